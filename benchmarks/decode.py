@@ -0,0 +1,90 @@
+"""
+decode time per packet type for every available codec
+
+payloads are shaped like what the server sends: init with the whole map, update with a
+few tiles and moved entities, remove_* with lists of uids
+
+    python -m benchmarks.decode --map-size 100 --creatures 300
+"""
+import random
+import time
+import uuid
+
+import click
+
+from lib.codec import BENCHMARK_CODECS
+
+
+def make_creature(rnd, map_size):
+    return {
+        'type': rnd.choice(['blob', 'skeleton']),
+        'coords': [rnd.randrange(map_size), rnd.randrange(map_size)],
+        'color': rnd.randrange(255),
+        'is_visible': rnd.random() < 0.5,
+    }
+
+
+def make_player(rnd, map_size):
+    return {
+        'coords': [rnd.randrange(map_size), rnd.randrange(map_size)],
+        'color': rnd.randrange(255),
+        'hit_points': rnd.randrange(100),
+    }
+
+
+def make_tile(rnd, x, y):
+    return [[x, y], rnd.choice(['wall', 'floor']), [True, rnd.random() < 0.3]]
+
+
+def make_packets(map_size, creature_count, player_count, seed=0):
+    rnd = random.Random(seed)
+    creature_uids = [str(uuid.UUID(int=rnd.getrandbits(128))) for _ in range(creature_count)]
+    player_uids = [str(uuid.UUID(int=rnd.getrandbits(128))) for _ in range(player_count)]
+
+    return {
+        'init': {'type': 'init', 'data': {
+            'map': [make_tile(rnd, x, y) for y in range(map_size) for x in range(map_size)],
+            'self': make_player(rnd, map_size),
+            'players': {uid: make_player(rnd, map_size) for uid in player_uids},
+            'creatures': {uid: make_creature(rnd, map_size) for uid in creature_uids},
+        }},
+        'update': {'type': 'update', 'data': {
+            'map': [make_tile(rnd, rnd.randrange(map_size), rnd.randrange(map_size)) for _ in range(80)],
+            'self': make_player(rnd, map_size),
+            'players': {uid: make_player(rnd, map_size) for uid in player_uids[:5]},
+            'creatures': {uid: make_creature(rnd, map_size) for uid in creature_uids[:creature_count // 10]},
+        }},
+        'remove_players': {'type': 'remove_players', 'data': player_uids[:3]},
+        'remove_creatures': {'type': 'remove_creatures', 'data': creature_uids[:20]},
+    }
+
+
+def time_decode(codec, data, min_time=0.2):
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        codec.decode(data)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / runs
+
+
+@click.command()
+@click.option('--map-size', default=100, show_default=True, help='init map is map-size x map-size tiles')
+@click.option('--creatures', 'creature_count', default=300, show_default=True)
+@click.option('--players', 'player_count', default=20, show_default=True)
+def main(map_size, creature_count, player_count):
+    packets = make_packets(map_size, creature_count, player_count)
+
+    print('%-18s %-12s %10s %14s' % ('packet', 'codec', 'bytes', 'us/packet'))
+    for packet_type, packet in packets.items():
+        for name, codec in BENCHMARK_CODECS.items():
+            data = codec.encode(packet)
+            print('%-18s %-12s %10d %14.1f' % (
+                packet_type, name, len(data), time_decode(codec, data) * 1e6
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+print_at calls and frame time of FrameComposer with and without run-length coalescing
+
+renders a full-screen map plus some sprites into a stub screen, once with a moving camera
+(every visible cell changes each frame) and once with a static camera (only the animated
+sprites change)
+
+    python -m benchmarks.render_runs --width 200 --height 60 --frames 200
+"""
+import random
+import time
+
+import click
+
+from benchmarks.stub_screen import StubScreen
+from lib.render import FrameComposer, MapLayer
+from lib.room import Room
+
+GLYPHS = {
+    'wall': '#',
+    'floor': '.',
+}
+
+
+def make_room(width, height):
+    room = Room()
+    tiles = []
+    for y in range(height):
+        for x in range(width):
+            name = 'wall' if x % 17 == 0 or y % 11 == 0 else 'floor'
+            # a lit area around the middle, the rest only seen
+            is_visible = abs(x - width // 2) < 30 and abs(y - height // 2) < 15
+            tiles.append(((x, y), name, (True, is_visible)))
+    room.update_room(tiles)
+    return room
+
+
+def run_frames(screen, room, frames, coalesce, moving, sprites):
+    frame = FrameComposer(screen, coalesce=coalesce)
+    map_layer = MapLayer(room, GLYPHS)
+    rnd = random.Random(1)
+    cells = ('o', 'O', '@')
+
+    # first frame is a full redraw in both modes, keep it out of the numbers
+    frame.begin()
+    map_layer.blit(frame, 0, 0)
+    frame.flush()
+    screen.reset_counters()
+
+    start = time.perf_counter()
+    for i in range(frames):
+        camera = i if moving else 0
+        frame.begin()
+        map_layer.blit(frame, camera, camera // 2)
+        for x, y in sprites:
+            char = cells[rnd.randrange(len(cells))]
+            for row in range(3):
+                frame.put_string(char * 3, x + row, y + row, colour=2)
+        frame.flush()
+    elapsed = time.perf_counter() - start
+    return screen.print_calls / frames, elapsed / frames * 1000
+
+
+@click.command()
+@click.option('--width', default=200, show_default=True)
+@click.option('--height', default=60, show_default=True)
+@click.option('--frames', default=200, show_default=True)
+@click.option('--sprites', 'sprite_count', default=50, show_default=True)
+def main(width, height, frames, sprite_count):
+    room = make_room(width * 2, height * 2)
+    rnd = random.Random(0)
+    sprites = [(rnd.randrange(width - 3), rnd.randrange(height - 3)) for _ in range(sprite_count)]
+
+    print('%-8s %-10s %14s %12s' % ('camera', 'mode', 'calls/frame', 'ms/frame'))
+    for moving in (True, False):
+        for coalesce in (False, True):
+            screen = StubScreen(width, height)
+            calls, ms = run_frames(screen, room, frames, coalesce, moving, sprites)
+            print('%-8s %-10s %14.1f %12.3f' % (
+                'moving' if moving else 'static',
+                'runs' if coalesce else 'per cell',
+                calls,
+                ms,
+            ))
+
+
+if __name__ == '__main__':
+    main()
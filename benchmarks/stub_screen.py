@@ -0,0 +1,41 @@
+from asciimatics.screen import Screen
+
+
+class StubScreen:
+    """
+    headless stand-in for an asciimatics screen
+
+    has the print_at / refresh / clear_buffer / get_event surface used by the client and
+    only counts what would have been sent to the terminal
+    """
+    COLOUR_BLACK = Screen.COLOUR_BLACK
+    COLOUR_WHITE = Screen.COLOUR_WHITE
+    COLOUR_GREEN = Screen.COLOUR_GREEN
+    COLOUR_MAGENTA = Screen.COLOUR_MAGENTA
+    A_NORMAL = Screen.A_NORMAL
+    A_BOLD = Screen.A_BOLD
+
+    def __init__(self, width=200, height=60):
+        self.width = width
+        self.height = height
+        self.print_calls = 0
+        self.printed_chars = 0
+        self.refreshes = 0
+
+    def print_at(self, text, x, y, colour=7, attr=0, bg=0, transparent=False):
+        self.print_calls += 1
+        self.printed_chars += len(text)
+
+    def refresh(self):
+        self.refreshes += 1
+
+    def clear_buffer(self, fg, attr, bg):
+        pass
+
+    def get_event(self):
+        return None
+
+    def reset_counters(self):
+        self.print_calls = 0
+        self.printed_chars = 0
+        self.refreshes = 0
@@ -0,0 +1,315 @@
+"""
+headless benchmark suite of the client hot paths
+
+every case drives the real client code against synthetic maps and entity counts:
+
+- room_tiles / room_runs: Room.update_room with the whole map as a legacy tile list or as
+  compact row runs
+- room_fov: field of view updates of a player walking across the map
+- tick: ScreenManager.tick, sprite animation and interpolation of all entities
+- draw: ScreenManager.draw_frame into a StubScreen, the player walks so the map scrolls
+- packets: Client.poll over decoded update and remove packets
+
+throughput is measured without tracing, memory is measured in a separate traced pass:
+'setup' is what the case keeps allocated before it runs (the map payload, the entities),
+'peak' is the most memory allocated on top of that during one run
+
+    python main.py bench --quick
+    python main.py bench --save benchmarks/baseline.json
+    python main.py bench --compare benchmarks/baseline.json
+"""
+import json
+import platform
+import random
+import time
+import tracemalloc
+import uuid
+
+import main
+from benchmarks.decode import make_creature, make_player
+from benchmarks.stub_screen import StubScreen
+from lib.creatures._sprite import sprite_library
+from lib.creatures.creature import CREATURE_SPRITES
+from lib.creatures.player import PLAYER_SPRITE
+from lib.mock_server import MockWorld
+
+BASELINE_VERSION = 1
+
+# map sides, 10k, 100k and 1M tiles
+MAP_SIDES = (100, 316, 1000)
+CREATURE_COUNTS = (10, 500, 5000)
+
+# --quick leaves out the largest sizes
+QUICK_MAP_SIDES = MAP_SIDES[:2]
+QUICK_CREATURE_COUNTS = CREATURE_COUNTS[:2]
+
+# map side of the tick, draw and packets cases
+ENTITY_MAP_SIDE = 316
+
+# changes smaller than this are noise
+DEFAULT_TOLERANCE = 0.1
+
+# peak memory below this is not compared
+MIN_COMPARED_KIB = 64
+
+
+def tile_name(x, y):
+    return 'wall' if x % 17 == 0 or y % 11 == 0 else 'floor'
+
+
+def make_map_tiles(side):
+    return [((x, y), tile_name(x, y), (True, x < 80 and y < 40)) for y in range(side) for x in range(side)]
+
+
+def make_map_runs(side):
+    runs = []
+    for y in range(side):
+        row = []
+        for x in range(side):
+            name = tile_name(x, y)
+            if row and row[-1][0] == name:
+                row[-1][1] += 1
+            else:
+                row.append([name, 1, True, False])
+        runs.append([0, y, row])
+    return {'runs': runs}
+
+
+def make_uids(rnd, count):
+    return [str(uuid.UUID(int=rnd.getrandbits(128))) for _ in range(count)]
+
+
+def spawn_entities(map_side, creature_count, player_count=20, seed=0, near=None):
+    """
+    reset the client state and fill it with a map and entities through the packet handlers
+
+    :param near: (width, height) of a window around the player to put all creatures in,
+        None to spread them over the map
+    :return: random generator, creature uids, player uids
+    """
+    rnd = random.Random(seed)
+    main.reset_game_state()
+    main.prediction.enabled = False
+
+    creature_uids = make_uids(rnd, creature_count)
+    player_uids = make_uids(rnd, player_count)
+    creatures_data = {uid: make_creature(rnd, map_side) for uid in creature_uids}
+    center = map_side // 2
+    if near:
+        width, height = near
+        for creature_data in creatures_data.values():
+            creature_data['coords'] = [center + rnd.randrange(-width // 2, width // 2),
+                                       center + rnd.randrange(-height // 2, height // 2)]
+
+    client = main.Client()
+    client.handle_packet({'type': 'init', 'data': {
+        'map': make_map_runs(map_side),
+        'self': dict(make_player(rnd, map_side), coords=[center, center]),
+        'players': {uid: make_player(rnd, map_side) for uid in player_uids},
+        'creatures': creatures_data,
+    }})
+    return rnd, creature_uids, player_uids
+
+
+def room_case(make_map):
+    def case(side):
+        def setup():
+            return make_map(side)
+
+        def run(payload):
+            main.Room().update_room(payload)
+            return side * side
+
+        return setup, run, 'tiles/s'
+    return case
+
+
+def fov_case(side, steps=50):
+    def setup():
+        world = MockWorld(side, creature_count=0, player_count=0)
+        room = main.Room()
+        room.update_room(world.map_runs())
+        # diagonal walk through the middle of the map
+        start = side // 2 - steps // 2
+        return room, [world.visibility(start + step, start + step) for step in range(steps)]
+
+    def run(state):
+        room, fovs = state
+        for fov in fovs:
+            room.update_room({'fov': fov})
+        return steps
+
+    return setup, run, 'updates/s'
+
+
+def tick_case(creature_count, frames=20):
+    def setup():
+        spawn_entities(ENTITY_MAP_SIDE, creature_count)
+        screen_manager = main.ScreenManager()
+        screen_manager.attach_screen(StubScreen())
+        return screen_manager
+
+    def run(screen_manager):
+        for _ in range(frames):
+            screen_manager.tick(1 / main.DEFAULT_FPS)
+        return frames * (len(main.creatures) + len(main.other_players) + 1)
+
+    return setup, run, 'entities/s'
+
+
+def draw_case(creature_count, frames=20):
+    def setup():
+        screen = StubScreen()
+        # crowd the creatures around the player, so that they are drawn
+        spawn_entities(ENTITY_MAP_SIDE, creature_count, near=(screen.width, screen.height))
+        screen_manager = main.ScreenManager()
+        screen_manager.attach_screen(screen)
+        # shown positions, as after the first tick
+        now = time.monotonic()
+        for creature in main.creatures.values():
+            creature.tick_motion(now)
+        return screen_manager
+
+    def run(screen_manager):
+        for _ in range(frames):
+            main.player.x = (main.player.x + 1) % ENTITY_MAP_SIDE
+            screen_manager.draw_frame()
+        return frames
+
+    return setup, run, 'frames/s'
+
+
+def packets_case(creature_count, packet_count=50):
+    def setup():
+        rnd, creature_uids, player_uids = spawn_entities(ENTITY_MAP_SIDE, creature_count)
+        moved = max(1, creature_count // 10)
+        packets = []
+        for idx in range(packet_count):
+            packets.append({'type': 'update', 'data': {
+                'self': make_player(rnd, ENTITY_MAP_SIDE),
+                'players': {uid: make_player(rnd, ENTITY_MAP_SIDE) for uid in player_uids[:5]},
+                'creatures': {uid: make_creature(rnd, ENTITY_MAP_SIDE) for uid in rnd.sample(creature_uids, moved)},
+            }})
+            if idx % 10 == 9:
+                # churn, the removed creatures come back with the next updates
+                packets.append({'type': 'remove_creatures', 'data': rnd.sample(creature_uids, moved)})
+        return main.Client(), packets
+
+    def run(state):
+        client, packets = state
+        received = time.monotonic()
+        client.inbox.extend((received, packet) for packet in packets)
+        client.poll()
+        client.applied.clear()
+        return len(packets)
+
+    return setup, run, 'packets/s'
+
+
+def cases(quick=False):
+    """
+    :param quick: leave out the largest maps and entity counts
+    :return: list of (name, case factory, size)
+    """
+    map_sides = QUICK_MAP_SIDES if quick else MAP_SIDES
+    creature_counts = QUICK_CREATURE_COUNTS if quick else CREATURE_COUNTS
+    result = []
+    for side in map_sides:
+        result.append(('room_tiles/%d' % (side * side), room_case(make_map_tiles), side))
+        result.append(('room_runs/%d' % (side * side), room_case(make_map_runs), side))
+        result.append(('room_fov/%d' % (side * side), fov_case, side))
+    for name, factory in (('tick', tick_case), ('draw', draw_case), ('packets', packets_case)):
+        for count in creature_counts:
+            result.append(('%s/%d' % (name, count), factory, count))
+    return result
+
+
+def measure(setup, run, min_time):
+    """
+    :param setup: returns the state passed to run
+    :param run: one repetition, returns the number of operations done
+    :param min_time: seconds to repeat run for
+    :return: operations per second, setup KiB, peak KiB
+    """
+    tracemalloc.start()
+    try:
+        state = setup()
+        setup_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run(state)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    ops = 0
+    start = time.perf_counter()
+    while True:
+        ops += run(state)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+    return ops / elapsed, setup_bytes / 1024, (peak - setup_bytes) / 1024
+
+
+def run_suite(quick=False, pattern=None, min_time=1.0, echo=print):
+    """
+    run all cases whose name contains pattern
+
+    :return: case name -> result dict
+    """
+    sprite_library.preload(list(CREATURE_SPRITES.values()) + [PLAYER_SPRITE])
+    results = {}
+    echo('%-20s %14s %-11s %12s %12s' % ('case', 'throughput', '', 'setup KiB', 'peak KiB'))
+    for name, factory, size in cases(quick):
+        if pattern and pattern not in name:
+            continue
+        setup, run, unit = factory(size)
+        throughput, setup_kib, peak_kib = measure(setup, run, min_time)
+        results[name] = {'throughput': throughput, 'unit': unit, 'setup_kib': setup_kib, 'peak_kib': peak_kib}
+        echo('%-20s %14.1f %-11s %12.0f %12.0f' % (name, throughput, unit, setup_kib, peak_kib))
+    main.reset_game_state()
+    return results
+
+
+def save_baseline(results, path):
+    with open(path, 'w') as f:
+        json.dump({
+            'version': BASELINE_VERSION,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError('%s: unsupported baseline version %s' % (path, baseline.get('version')))
+    return baseline
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE, echo=print):
+    """
+    print the change of every case against the baseline
+
+    :return: names of the cases that got slower or use more memory than the tolerance allows
+    """
+    regressions = []
+    echo('%-20s %10s %10s' % ('case', 'speed', 'peak mem'))
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            echo('%-20s %10s' % (name, 'new'))
+            continue
+        speed = result['throughput'] / base['throughput']
+        memory = None
+        if max(result['peak_kib'], base['peak_kib']) >= MIN_COMPARED_KIB:
+            memory = result['peak_kib'] / max(base['peak_kib'], 1)
+
+        regressed = speed < 1 - tolerance or (memory is not None and memory > 1 + tolerance)
+        if regressed:
+            regressions.append(name)
+        echo('%-20s %9.2fx %10s%s' % (
+            name, speed, '-' if memory is None else '%.2fx' % memory, '  REGRESSION' if regressed else ''))
+    return regressions
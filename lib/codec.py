@@ -0,0 +1,116 @@
+"""
+wire formats for packets
+
+json is always available and uses the fastest installed decoder (orjson, ujson, stdlib).
+binary encodings are only offered to the server if their library is installed
+"""
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+logger = logging.getLogger(__name__)
+
+
+class Codec:
+    name = None
+    # sent as websocket BINARY instead of TEXT frames
+    binary = False
+
+    def decode(self, data):
+        raise NotImplementedError
+
+    def encode(self, packet):
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    name = 'json'
+
+    def __init__(self):
+        if orjson is not None:
+            self.decoder = 'orjson'
+            self.decode = orjson.loads
+        elif ujson is not None:
+            self.decoder = 'ujson'
+            self.decode = ujson.loads
+        else:
+            self.decoder = 'json'
+            self.decode = json.loads
+
+    def encode(self, packet):
+        return json.dumps(packet)
+
+
+class StdlibJsonCodec(Codec):
+    """
+    plain json module, the reference for benchmarks
+    """
+    name = 'json-stdlib'
+
+    def decode(self, data):
+        return json.loads(data)
+
+    def encode(self, packet):
+        return json.dumps(packet)
+
+
+class MsgpackCodec(Codec):
+    name = 'msgpack'
+    binary = True
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+    def encode(self, packet):
+        return msgpack.packb(packet, use_bin_type=True)
+
+
+class CborCodec(Codec):
+    name = 'cbor'
+    binary = True
+
+    def decode(self, data):
+        return cbor2.loads(data)
+
+    def encode(self, packet):
+        return cbor2.dumps(packet)
+
+
+# encodings a client can offer to the server
+CODECS = {
+    JsonCodec.name: JsonCodec(),
+}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+if cbor2 is not None:
+    CODECS[CborCodec.name] = CborCodec()
+
+# text frames are always decoded with JsonCodec, the stdlib one is only compared against it
+BENCHMARK_CODECS = dict(CODECS)
+BENCHMARK_CODECS[StdlibJsonCodec.name] = StdlibJsonCodec()
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError('unknown or unavailable encoding %s, available: %s' % (name, ', '.join(CODECS)))
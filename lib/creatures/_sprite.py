@@ -1,39 +1,30 @@
 import logging
-import random
 
-from lib.init_logging import init_logging
-from ruamel.yaml import YAML
+from lib.creatures._sprite_cache import read_cache, write_cache
+from lib.creatures.animation import animator as default_animator
 
-init_logging('debug')
 logger = logging.getLogger(__name__)
 
-yaml = YAML()
-
 
 class Frame:
-    def __init__(self, ms, cells, is_random, idx):
-        self.ms = ms
-        self.cells = cells
-        self.is_random = is_random
-        self.idx = idx
-
-    def make_current_frame(self):
-        if self.is_random:
-            ms = random.randint(self.ms[0], self.ms[1])
-        else:
-            ms = self.ms
-        return CurrentFrame(ms=ms, cells=self.cells, idx=self.idx, timer=0)
+    """
+    a single compiled animation frame
 
+    frames are shared between all sprites loaded from the same file,
+    so they must never be modified after loading
+    """
+    __slots__ = ('ms', 'cells', 'is_random', 'idx')
 
-class CurrentFrame:
-    def __init__(self, ms, cells, idx, timer):
+    def __init__(self, ms, cells, is_random, idx):
         self.ms = ms
         self.cells = cells
+        self.is_random = is_random
         self.idx = idx
-        self.timer = timer
 
 
 class CurrentEffect:
+    __slots__ = ('ms', 'timer', 'color', 'attr', 'bg')
+
     def __init__(self, ms, color=None, attr=0, bg=0):
         self.ms = ms
         self.timer = 0
@@ -42,69 +33,201 @@ class CurrentEffect:
         self.bg = bg
 
 
+class SpriteData:
+    """
+    immutable frame tables of one sprite file: state -> direction -> frames
+    """
+
+    def __init__(self, path, states):
+        self.path = path
+        self.states = states
+
+    @classmethod
+    def load(cls, path, use_cache=True):
+        """
+        load a sprite file, from the compiled cache if it is fresh
+
+        :param path:
+        :param use_cache: False to always parse the yaml and leave the cache alone
+        :return:
+        """
+        tables = read_cache(path) if use_cache else None
+        if tables is None:
+            tables = cls.parse(path)
+            if use_cache:
+                write_cache(path, tables)
+
+        states = {}
+        for state, directions in tables.items():
+            states[state] = {}
+            for direction, frames in directions.items():
+                states[state][direction] = tuple(
+                    Frame(ms=ms, is_random=is_random, cells=cells, idx=idx)
+                    for idx, (ms, cells, is_random) in enumerate(frames)
+                )
+        return cls(path, states)
+
+    @staticmethod
+    def parse(path):
+        """
+        parse a sprite yaml into plain tables
+
+        :param path:
+        :return: state -> direction -> tuple of (ms, cells, is_random)
+        """
+        # only imported when a cache entry is missing or stale
+        from ruamel.yaml import YAML
+
+        tables = {}
+        with open(path, 'r') as f:
+            sprite_data = YAML().load(f)
+            for state, directions in sprite_data.items():
+                tables[str(state)] = {}
+                for direction, frames in directions.items():
+                    compiled = []
+                    for frame in frames:
+                        is_random = bool(frame.get('random', False))
+                        # plain python types only, loading the cache must not need ruamel
+                        ms = frame['ms']
+                        if is_random:
+                            ms = (int(ms[0]), int(ms[1]))
+                        else:
+                            ms = int(ms)
+                        cells = tuple(
+                            tuple(None if char is None else str(char) for char in row)
+                            for row in frame['cells']
+                        )
+                        compiled.append((ms, cells, is_random))
+                    tables[str(state)][str(direction)] = tuple(compiled)
+        return tables
+
+
+class SpriteLibrary:
+    """
+    process wide cache of loaded sprite files
+
+    every sprite file is parsed once, all Sprites created for it share the same SpriteData
+    """
+
+    def __init__(self):
+        self.sprites = {}
+
+    def get(self, path):
+        sprite_data = self.sprites.get(path)
+        if sprite_data is None:
+            sprite_data = self.load(path)
+        return sprite_data
+
+    def load(self, path):
+        """
+        (re)load a sprite file, replacing the cached version
+
+        :param path:
+        :return:
+        """
+        logger.debug('loading sprite %s' % path)
+        sprite_data = SpriteData.load(path)
+        self.sprites[path] = sprite_data
+        return sprite_data
+
+    def preload(self, paths):
+        for path in paths:
+            self.get(path)
+
+
+sprite_library = SpriteLibrary()
+
+
 class Sprite:
-    def __init__(self, path):
-        self.states = {}
-        self.load(path)
+    """
+    animation cursor for one entity
+
+    holds only the state and direction, the frame timers live in a slot of the animator,
+    which advances all active sprites at once. Frame tables come from the shared sprite
+    library
+    """
+    __slots__ = ('data', 'animator', 'slot', 'current_state', 'current_direction')
+
+    def __init__(self, path, reload=False, animator=default_animator):
+        if reload:
+            self.data = sprite_library.load(path)
+        else:
+            self.data = sprite_library.get(path)
+
+        self.animator = animator
+        self.slot = animator.add()
+        self.reset()
 
+    def __del__(self):
+        try:
+            self.animator.remove(self.slot)
+        except AttributeError:
+            # __init__ did not get that far
+            pass
+
+    def reset(self):
+        """
+        rewind to the first idle frame and drop the current effect
+
+        :return:
+        """
         self.current_state = 'idle'
         self.current_direction = 'right'
+        self.animator.start(self.slot, self.animator.clip_id(self.current_state_frames))
+        self.animator.effects.pop(self.slot, None)
 
-        self.current_frame = self.current_state_frames[0].make_current_frame()
-
-        self.current_effect: CurrentEffect = None
+    @property
+    def states(self):
+        return self.data.states
 
     @property
     def current_state_frames(self):
-        return self.states[self.current_state][self.current_direction]
+        return self.data.states[self.current_state][self.current_direction]
 
-    def tick(self, dt, state, direction):
-        # if we are doing this for the first time or something changed
-        if not self.current_frame \
-                or state != self.current_state \
-                or direction != self.current_direction:
+    @property
+    def active(self):
+        """
+        True if animator.tick advances this sprite, or will once it wakes up
+        """
+        return bool(self.animator.active[self.slot]) or self.slot in self.animator.asleep
+
+    @active.setter
+    def active(self, value):
+        self.animator.set_active(self.slot, value)
+
+    def set_state(self, state, direction):
+        """
+        switch to the frames of another state or direction, starting with the first one
+
+        :param state:
+        :param direction:
+        :return:
+        """
+        if state != self.current_state or direction != self.current_direction:
             self.current_state = state
             self.current_direction = direction
-            frame: Frame = self.current_state_frames[0]
-            self.current_frame = frame.make_current_frame()
-
-        # the actual tick
-        self.current_frame.timer += dt
-        # logger.debug('timer %s / %s' % (self.current_frame.timer, self.current_frame.ms / 1000))
+            self.animator.start(self.slot, self.animator.clip_id(self.current_state_frames))
 
-        # set next frame, if timer over ms for this frame
-        if self.current_frame.timer > (self.current_frame.ms / 1000):
-            next_frame_idx = (self.current_frame.idx + 1) % len(self.current_state_frames)
-            frame: Frame = self.current_state_frames[next_frame_idx]
-            self.current_frame = frame.make_current_frame()
+    def tick(self, dt, state, direction):
+        """
+        advance only this sprite, whether it is active or not, e.g. in the sprite editor
 
-        # process current effect
-        if self.current_effect:
-            self.current_effect.timer += dt
-            if self.current_effect.timer > (self.current_effect.ms / 1000):
-                self.current_effect = None
+        :param dt:
+        :param state:
+        :param direction:
+        :return:
+        """
+        self.set_state(state, direction)
+        self.animator.advance(self.slot, dt)
 
     def add_current_effect(self, ms, color=None, attr=0, bg=0):
-        self.current_effect = CurrentEffect(ms, color, attr, bg)
+        self.animator.effects[self.slot] = CurrentEffect(ms, color, attr, bg)
 
     def get_cells(self):
-        return self.current_frame.cells
+        return self.animator.cells[self.slot]
 
     def get_effects(self):
-        if self.current_effect:
-            return self.current_effect.color, self.current_effect.attr, self.current_effect.bg
+        effect = self.animator.effects.get(self.slot)
+        if effect:
+            return effect.color, effect.attr, effect.bg
         return None, 0, 0
-
-    def load(self, path):
-        with open(path, 'r') as f:
-            sprite_data = yaml.load(f)
-            for state, directions in sprite_data.items():
-                self.states[state] = {}
-                for direction, frames in directions.items():
-                    self.states[state][direction] = []
-                    for idx, frame in enumerate(frames):
-                        is_random = frame.get('random', False)
-                        ms = frame['ms']
-                        cells = frame['cells']
-                        f = Frame(ms=ms, is_random=is_random, cells=cells, idx=idx)
-                        self.states[state][direction].append(f)
@@ -0,0 +1,90 @@
+"""
+on disk cache of compiled sprite files
+
+a cache entry stores the frame tables of one sprite file as json together with the path,
+mtime and size of the yaml it was built from, so a changed source is detected without
+parsing it. json only holds data, nothing in the cache directory can run code
+"""
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+SPRITE_CACHE_DIR = '.sprite_cache'
+
+# bump when the layout of the cached tables changes
+SPRITE_CACHE_VERSION = 2
+
+
+def cache_path(path, cache_dir=SPRITE_CACHE_DIR):
+    name = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, '%s.json' % name)
+
+
+def source_key(path):
+    stat = os.stat(path)
+    return SPRITE_CACHE_VERSION, os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def _tables_from_json(tables):
+    # json has no tuples, the frame tables are immutable
+    return {
+        str(state): {
+            str(direction): tuple(
+                (tuple(ms) if is_random else int(ms), tuple(tuple(row) for row in cells), bool(is_random))
+                for ms, cells, is_random in frames
+            )
+            for direction, frames in directions.items()
+        }
+        for state, directions in tables.items()
+    }
+
+
+def read_cache(path, cache_dir=SPRITE_CACHE_DIR):
+    """
+    get the cached tables for a sprite file
+
+    :param path: path of the sprite yaml
+    :param cache_dir:
+    :return: the cached tables or None if there is no fresh entry
+    """
+    try:
+        key = source_key(path)
+        with open(cache_path(path, cache_dir), encoding='utf-8') as f:
+            entry = json.load(f)
+        cached_key = tuple(entry['key'])
+        tables = _tables_from_json(entry['tables'])
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning('could not read sprite cache for %s: %s' % (path, e))
+        return None
+
+    if cached_key != key:
+        logger.debug('sprite cache for %s is stale' % path)
+        return None
+    return tables
+
+
+def write_cache(path, tables, cache_dir=SPRITE_CACHE_DIR):
+    """
+    store the tables for a sprite file, failures are only logged
+
+    :param path: path of the sprite yaml
+    :param tables: state -> direction -> tuple of (ms, cells, is_random)
+    :param cache_dir:
+    :return: True if the entry was written
+    """
+    target = cache_path(path, cache_dir)
+    tmp = '%s.%s.tmp' % (target, os.getpid())
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'key': source_key(path), 'tables': tables}, f)
+        os.replace(tmp, target)
+    except OSError as e:
+        logger.warning('could not write sprite cache for %s: %s' % (path, e))
+        return False
+    return True
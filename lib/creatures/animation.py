@@ -0,0 +1,388 @@
+"""
+animation state of all sprites in parallel arrays, advanced in one pass per frame
+
+every Sprite owns a slot in the Animator. The frame tables of all sprite files are
+flattened into clips (the frames of one state and direction) and one list of frames, so
+a slot is just a few numbers: clip, frame index in the clip and the time its frame ends.
+Frame end times are on the animator clock, which only active slots follow, so a tick
+advances the clock and moves on the slots whose frame ended: with numpy in a few vector
+operations, without it in one comprehension. Durations of random frames are drawn from a
+pool of random numbers made in bulk.
+
+slots of entities out of view can be put to sleep: they are not ticked, and when they
+wake up their animation is fast-forwarded by the time they slept in one step, using the
+mean duration of random frames
+"""
+import logging
+import random
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# random numbers drawn at once for frames with a random duration
+RANDOM_POOL_SIZE = 4096
+
+INITIAL_CAPACITY = 256
+
+
+class Animator:
+    def __init__(self, use_numpy=True, capacity=INITIAL_CAPACITY):
+        self.use_numpy = use_numpy and numpy is not None
+
+        # seconds ticked so far
+        self.clock = 0.0
+
+        # clips: tuple of Frames of one state and direction, registered on first use
+        self.clip_ids = {}
+        self.clips = []
+        self.clip_start = self._array('i', [])
+        self.clip_length = self._array('i', [])
+        # seconds of one loop through the clip, with the mean of random durations
+        self.clip_cycle = []
+
+        # all frames of all clips, indexed by clip start + frame index
+        self.frame_min_ms = []
+        self.frame_max_ms = []
+        self.frame_cells = []
+        self.frame_min_ms_array = self.frame_max_ms_array = None
+
+        # per slot: the clock time the current frame ends at, for inactive slots the
+        # seconds left of it. cells is a plain list so that drawing does not touch the arrays
+        self.size = 0
+        self.capacity = 0
+        self.free = []
+        self.cells = []
+        self.clip = self.idx = self.deadline = self.active = None
+        self._grow(capacity)
+
+        # slot -> CurrentEffect, effects are rare and ticked one by one
+        self.effects = {}
+
+        # slots put to sleep and not woken yet, active or not
+        self.sleeping = set()
+        # slot -> clock time it stopped being ticked, for the active slots among them
+        self.asleep = {}
+
+        self.random_pool = None
+        self.random_pos = 0
+        self._draw_random_pool()
+
+    def _array(self, typecode, values):
+        if self.use_numpy:
+            dtype = {'i': numpy.int32, 'd': numpy.float64, 'b': numpy.bool_}[typecode]
+            return numpy.array(values, dtype=dtype)
+        return array(typecode, values)
+
+    def _grow(self, capacity):
+        def grown(old, typecode, fill):
+            values = list(old[:self.size]) if old is not None else []
+            return self._array(typecode, values + [fill] * (capacity - len(values)))
+
+        self.clip = grown(self.clip, 'i', 0)
+        self.idx = grown(self.idx, 'i', 0)
+        self.deadline = grown(self.deadline, 'd', 0.0)
+        self.active = grown(self.active, 'b', False)
+        self.capacity = capacity
+
+    def _draw_random_pool(self):
+        if self.use_numpy:
+            self.random_pool = numpy.random.random(RANDOM_POOL_SIZE)
+        else:
+            self.random_pool = [random.random() for _ in range(RANDOM_POOL_SIZE)]
+        self.random_pos = 0
+
+    def _randoms(self, count):
+        """
+        the next count numbers of the random pool, in [0, 1)
+        """
+        if self.random_pos + count > RANDOM_POOL_SIZE:
+            if count > RANDOM_POOL_SIZE:
+                if self.use_numpy:
+                    return numpy.random.random(count)
+                return [random.random() for _ in range(count)]
+            self._draw_random_pool()
+        start = self.random_pos
+        self.random_pos += count
+        return self.random_pool[start:start + count]
+
+    def _frame_duration(self, frame):
+        low, high = self.frame_min_ms[frame], self.frame_max_ms[frame]
+        return (low + int(self._randoms(1)[0] * (high - low + 1))) / 1000
+
+    def _mean_duration(self, frame):
+        return (self.frame_min_ms[frame] + self.frame_max_ms[frame]) / 2000
+
+    def clip_id(self, frames):
+        """
+        :param frames: tuple of Frames of a state and direction, shared by all sprites of a file
+        :return: clip id
+        """
+        clip = self.clip_ids.get(id(frames))
+        if clip is not None and self.clips[clip] is frames:
+            return clip
+
+        clip = len(self.clips)
+        self.clip_ids[id(frames)] = clip
+        self.clips.append(frames)
+        start = len(self.frame_cells)
+        for frame in frames:
+            low, high = frame.ms if frame.is_random else (frame.ms, frame.ms)
+            self.frame_min_ms.append(low)
+            self.frame_max_ms.append(high)
+            self.frame_cells.append(frame.cells)
+        self.clip_cycle.append(sum(self._mean_duration(start + idx) for idx in range(len(frames))))
+        if self.use_numpy:
+            self.clip_start = numpy.append(self.clip_start, numpy.int32(start))
+            self.clip_length = numpy.append(self.clip_length, numpy.int32(len(frames)))
+            self.frame_min_ms_array = numpy.array(self.frame_min_ms, dtype=numpy.float64)
+            self.frame_max_ms_array = numpy.array(self.frame_max_ms, dtype=numpy.float64)
+        else:
+            self.clip_start.append(start)
+            self.clip_length.append(len(frames))
+        return clip
+
+    def add(self):
+        """
+        :return: a new slot, inactive until set_active
+        """
+        if self.free:
+            return self.free.pop()
+        if self.size == self.capacity:
+            self._grow(self.capacity * 2)
+        slot = self.size
+        self.size += 1
+        self.cells.append(())
+        return slot
+
+    def remove(self, slot):
+        self.sleeping.discard(slot)
+        self.asleep.pop(slot, None)
+        self.set_active(slot, False)
+        self.effects.pop(slot, None)
+        self.cells[slot] = ()
+        self.free.append(slot)
+
+    def set_active(self, slot, active):
+        """
+        active slots are advanced by tick, inactive ones keep their frame and timer. A
+        sleeping slot that is activated stays asleep until wake
+
+        :param slot:
+        :param active:
+        :return:
+        """
+        if slot in self.sleeping:
+            if active:
+                # the time asleep counts from now on
+                self.asleep.setdefault(slot, self.clock)
+                return
+            # the time asleep counts, from now on the slot is frozen
+            self._catch_up(slot)
+        self._set_active(slot, active)
+
+    def _set_active(self, slot, active):
+        if bool(self.active[slot]) == active:
+            return
+        self.active[slot] = active
+        # switch between clock time and time left
+        if active:
+            self.deadline[slot] += self.clock
+        else:
+            self.deadline[slot] -= self.clock
+
+    def _set_frame(self, slot, frame):
+        """
+        start a frame at the current clock time
+
+        :param slot:
+        :param frame: index in the frames of all clips
+        :return:
+        """
+        duration = self._frame_duration(frame)
+        self.deadline[slot] = self.clock + duration if self.active[slot] else duration
+        self.cells[slot] = self.frame_cells[frame]
+
+    def start(self, slot, clip):
+        """
+        play a clip from its first frame
+
+        :param slot:
+        :param clip: clip id
+        :return:
+        """
+        self.clip[slot] = clip
+        self.idx[slot] = 0
+        self._set_frame(slot, int(self.clip_start[clip]))
+
+    def _next_frame(self, slot):
+        clip = int(self.clip[slot])
+        idx = (int(self.idx[slot]) + 1) % int(self.clip_length[clip])
+        self.idx[slot] = idx
+        self._set_frame(slot, int(self.clip_start[clip]) + idx)
+
+    def sleep(self, slot):
+        """
+        stop ticking a slot until wake, e.g. while its entity is out of view
+
+        :param slot:
+        :return:
+        """
+        if slot in self.sleeping:
+            return
+        self.sleeping.add(slot)
+        if self.active[slot]:
+            self._set_active(slot, False)
+            self.asleep[slot] = self.clock
+
+    def wake(self, slot):
+        """
+        tick a sleeping slot again, its animation continues as if it had been ticked
+
+        :param slot:
+        :return:
+        """
+        self.sleeping.discard(slot)
+        self._catch_up(slot)
+
+    def _catch_up(self, slot):
+        since = self.asleep.pop(slot, None)
+        if since is not None:
+            self._set_active(slot, True)
+            self._fast_forward(slot, self.clock - since)
+
+    def _fast_forward(self, slot, elapsed):
+        """
+        skip elapsed seconds of an active slot without going through every frame change
+
+        whole loops through the clip are skipped at once, so this does not depend on the
+        time elapsed
+
+        :param slot:
+        :param elapsed: seconds
+        :return:
+        """
+        left = self.remaining(slot) - elapsed
+        if left >= 0:
+            self.deadline[slot] -= elapsed
+            return
+
+        clip = int(self.clip[slot])
+        start = int(self.clip_start[clip])
+        length = int(self.clip_length[clip])
+        cycle = self.clip_cycle[clip]
+        # time already spent in the frames after the current one
+        spent = -left
+        if cycle > 0:
+            spent %= cycle
+        idx = (int(self.idx[slot]) + 1) % length
+        for _ in range(length):
+            mean = self._mean_duration(start + idx)
+            if spent < mean:
+                break
+            spent -= mean
+            idx = (idx + 1) % length
+        self.idx[slot] = idx
+        self._set_frame(slot, start + idx)
+        self.deadline[slot] -= spent
+
+    def remaining(self, slot):
+        """
+        seconds left of the current frame of a slot
+        """
+        if self.active[slot]:
+            return float(self.deadline[slot]) - self.clock
+        return float(self.deadline[slot])
+
+    def advance(self, slot, dt):
+        """
+        tick a single slot, active or not
+
+        :param slot:
+        :param dt: seconds
+        :return:
+        """
+        self.deadline[slot] -= dt
+        if self.remaining(slot) < 0:
+            self._next_frame(slot)
+        self._tick_effect(slot, dt)
+
+    def _tick_effect(self, slot, dt):
+        effect = self.effects.get(slot)
+        if effect is not None:
+            effect.timer += dt
+            if effect.timer > effect.ms / 1000:
+                del self.effects[slot]
+
+    def tick(self, dt):
+        """
+        advance all active slots by dt seconds
+
+        like a single Sprite.tick, a slot moves on by at most one frame per tick and the
+        next frame starts at the time of the tick
+
+        :param dt: seconds
+        :return:
+        """
+        self.clock += dt
+        if self.use_numpy:
+            self._tick_numpy()
+        else:
+            self._tick_python()
+
+        for slot in list(self.effects):
+            if self.active[slot] or slot in self.asleep:
+                self._tick_effect(slot, dt)
+
+    def _tick_numpy(self):
+        n = self.size
+        due = numpy.flatnonzero(self.active[:n] & (self.deadline[:n] < self.clock))
+        if not due.size:
+            return
+
+        clip = self.clip[due]
+        idx = (self.idx[due] + 1) % self.clip_length[clip]
+        frames = self.clip_start[clip] + idx
+        low = self.frame_min_ms_array[frames]
+        high = self.frame_max_ms_array[frames]
+        self.idx[due] = idx
+        self.deadline[due] = self.clock + (low + numpy.floor(self._randoms(due.size) * (high - low + 1))) / 1000
+
+        cells = self.cells
+        frame_cells = self.frame_cells
+        for slot, frame in zip(due.tolist(), frames.tolist()):
+            cells[slot] = frame_cells[frame]
+
+    def _tick_python(self):
+        clock = self.clock
+        due = [slot for slot, (active, deadline) in enumerate(zip(self.active, self.deadline))
+               if active and deadline < clock]
+        for slot in due:
+            self._next_frame(slot)
+
+    def time_to_next_frame(self):
+        """
+        seconds until a tick changes what any active slot shows
+
+        :return: None if nothing is animated
+        """
+        n = self.size
+        if self.use_numpy:
+            deadlines = self.deadline[:n][self.active[:n]]
+            next_deadline = float(deadlines.min()) if deadlines.size else None
+        else:
+            next_deadline = min((deadline for active, deadline in zip(self.active, self.deadline) if active),
+                                default=None)
+        remaining = None if next_deadline is None else next_deadline - self.clock
+        for slot, effect in self.effects.items():
+            if self.active[slot]:
+                left = effect.ms / 1000 - effect.timer
+                remaining = left if remaining is None else min(remaining, left)
+        return None if remaining is None else max(remaining, 0)
+
+
+animator = Animator()
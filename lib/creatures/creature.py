@@ -1,11 +1,15 @@
 import logging
+import time
 
 from lib.creatures._sprite import Sprite
-from lib.init_logging import init_logging
+from lib.creatures.motion import Interpolator
+from lib.init_logging import LogSample
 
-init_logging('debug')
 logger = logging.getLogger(__name__)
 
+# creature updates are logged one in this many
+update_sample = LogSample(100)
+
 CREATURE_SPRITES = {
     'blob': 'sprites/blob.yaml',
     'skeleton': 'sprites/skeleton.yaml'
@@ -13,29 +17,42 @@ CREATURE_SPRITES = {
 
 
 class Creature:
+    __slots__ = ('x', 'y', 'color', 'type', 'direction', 'state', 'is_visible', 'sprite', 'motion')
+
     def __init__(self, type):
+        self.type = type
+        self.sprite = Sprite(CREATURE_SPRITES[type])
+        self.motion = Interpolator()
+        self.reset()
+
+    def reset(self):
+        """
+        back to the state of a freshly spawned creature, used when recycling it
+
+        :return:
+        """
         self.x = 0
         self.y = 0
         self.color = 0
 
-        self.type = type
-
         self.direction = 'right'
         self.state = 'idle'
 
         self.is_visible = True
 
-        self.sprite = Sprite(CREATURE_SPRITES[type])
+        self.sprite.reset()
+        # not animated until the next update, e.g. while waiting in the pool
+        self.sprite.active = False
+        self.motion.reset()
 
-    def tick_sprite_state(self, dt):
+    def tick_motion(self, now):
         """
-        update sprite from game loop
-        
-        :param dt: 
-        :return: 
+        move towards the last position from the server
+
+        :param now: time.monotonic()
+        :return:
         """
-        if self.is_visible:
-            self.sprite.tick(dt, self.state, self.direction)
+        self.x, self.y = self.motion.cell(now)
 
     def update(self, update_data):
         """
@@ -44,9 +61,12 @@ class Creature:
         :param update_data: 
         :return: 
         """
-        logger.info(update_data)
-        self.x, self.y = update_data['coords']
+        if logger.isEnabledFor(logging.DEBUG) and update_sample():
+            logger.debug('creature update (1 in %d): %s', update_sample.every, update_data)
+        x, y = update_data['coords']
+        self.motion.set_target(x, y, time.monotonic())
         self.color = update_data['color']
         self.is_visible = update_data['is_visible']
+        self.sprite.active = self.is_visible
 
         # todo: direction, state
@@ -0,0 +1,152 @@
+"""
+smoothing of entity movement between server updates
+
+other players and creatures are interpolated between their last two positions, the local
+player is moved immediately on key press and reconciled with the positions from the server
+"""
+import math
+import time
+from collections import deque
+
+# updates further apart than this (seconds) are interpolated over this time at most
+MAX_INTERPOLATION_TIME = 0.5
+
+# jumps further than this (tiles) are not interpolated
+TELEPORT_DISTANCE = 4
+
+# predicted moves the server has not shown after this many seconds are dropped
+PREDICTION_TIMEOUT = 0.5
+
+MOVES = {
+    'up': (0, -1),
+    'down': (0, 1),
+    'left': (-1, 0),
+    'right': (1, 0),
+}
+
+
+def _sign(value):
+    return (value > 0) - (value < 0)
+
+
+class Interpolator:
+    """
+    moves from the position shown when an update arrived to the new position,
+    over the time that passed since the update before
+    """
+    __slots__ = ('from_x', 'from_y', 'to_x', 'to_y', 'start', 'duration', 'last_update')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.from_x = self.to_x = 0
+        self.from_y = self.to_y = 0
+        self.start = 0
+        self.duration = 0
+        self.last_update = None
+
+    def set_target(self, x, y, now):
+        if self.last_update is None \
+                or abs(x - self.to_x) > TELEPORT_DISTANCE or abs(y - self.to_y) > TELEPORT_DISTANCE:
+            self.from_x, self.from_y = x, y
+            self.duration = 0
+        else:
+            self.from_x, self.from_y = self.position(now)
+            self.duration = min(now - self.last_update, MAX_INTERPOLATION_TIME)
+        self.to_x, self.to_y = x, y
+        self.start = now
+        self.last_update = now
+
+    def position(self, now):
+        """
+        :param now:
+        :return: x, y as floats
+        """
+        if self.duration <= 0:
+            return self.to_x, self.to_y
+        t = min((now - self.start) / self.duration, 1)
+        return self.from_x + (self.to_x - self.from_x) * t, self.from_y + (self.to_y - self.from_y) * t
+
+    def cell(self, now):
+        x, y = self.position(now)
+        return math.floor(x + 0.5), math.floor(y + 0.5)
+
+
+class Prediction:
+    """
+    local movement of the own player ahead of the server
+
+    the server does not acknowledge actions, so a pending move counts as processed once the
+    server position moved in its direction, or after PREDICTION_TIMEOUT (e.g. it ran into
+    something the client did not know about)
+    """
+
+    def __init__(self, timeout=PREDICTION_TIMEOUT, enabled=True):
+        self.enabled = enabled
+        self.timeout = timeout
+        # (time sent, dx, dy)
+        self.pending = deque()
+
+        self.server_x = None
+        self.server_y = None
+
+    def predict(self, entity, action, is_blocked=None, now=None):
+        """
+        move an entity right away for a movement action
+
+        :param entity: anything with x and y
+        :param action: action sent to the server
+        :param is_blocked: optional callable(x, y), True if the entity can not move there
+        :param now:
+        :return: True if the entity was moved
+        """
+        move = MOVES.get(action)
+        if move is None or self.server_x is None:
+            return False
+        dx, dy = move
+        x, y = entity.x + dx, entity.y + dy
+        if is_blocked is not None and is_blocked(x, y):
+            return False
+        self.pending.append((time.monotonic() if now is None else now, dx, dy))
+        entity.x, entity.y = x, y
+        return True
+
+    def reconcile(self, entity, x, y, now=None):
+        """
+        place an entity at the server position plus the moves the server did not apply yet
+
+        :param entity: anything with x and y
+        :param x: server x
+        :param y: server y
+        :param now:
+        :return:
+        """
+        now = time.monotonic() if now is None else now
+        pending = self.pending
+
+        if self.server_x is not None:
+            dx = x - self.server_x
+            dy = y - self.server_y
+            while pending and (dx or dy):
+                _, move_x, move_y = pending[0]
+                if (move_x and _sign(move_x) == _sign(dx)) or (move_y and _sign(move_y) == _sign(dy)):
+                    dx -= move_x
+                    dy -= move_y
+                    pending.popleft()
+                else:
+                    break
+        self.server_x, self.server_y = x, y
+
+        while pending and pending[0][0] < now - self.timeout:
+            pending.popleft()
+
+        for _, move_x, move_y in pending:
+            x += move_x
+            y += move_y
+        entity.x, entity.y = x, y
+
+    def reset(self):
+        self.pending.clear()
+        self.server_x = None
+        self.server_y = None
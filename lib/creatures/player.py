@@ -1,35 +1,52 @@
 import logging
+import time
 
 from lib.creatures._sprite import Sprite
-from lib.init_logging import init_logging
+from lib.creatures.motion import Interpolator
 
-init_logging('debug')
 logger = logging.getLogger(__name__)
 
+PLAYER_SPRITE = 'sprites/player.yaml'
+
 
 class Player:
+    __slots__ = ('x', 'y', 'color', 'hit_points', 'direction', 'state', 'is_visible', 'sprite', 'motion')
+
     def __init__(self):
+        self.sprite = Sprite(PLAYER_SPRITE)
+        self.motion = Interpolator()
+        self.reset()
+
+    def reset(self):
+        """
+        back to the state of a freshly joined player, used when recycling it
+
+        :return:
+        """
         self.x = 0
         self.y = 0
         self.color = 0
-        
+
         self.hit_points = 0
 
         self.direction = 'right'
         self.state = 'idle'
-        
+
         self.is_visible = True
 
-        self.sprite = Sprite('sprites/player.yaml')
+        self.sprite.reset()
+        # not animated until the next update, e.g. while waiting in the pool
+        self.sprite.active = False
+        self.motion.reset()
 
-    def tick_sprite_state(self, dt):
+    def tick_motion(self, now):
         """
-        update sprite from game loop
-        
-        :param dt: 
-        :return: 
+        move towards the last position from the server
+
+        :param now: time.monotonic()
+        :return:
         """
-        self.sprite.tick(dt, self.state, self.direction)
+        self.x, self.y = self.motion.cell(now)
 
     def update(self, update_data):
         """
@@ -38,8 +55,10 @@ class Player:
         :param update_data: 
         :return: 
         """
-        self.x, self.y = update_data['coords']
+        x, y = update_data['coords']
+        self.motion.set_target(x, y, time.monotonic())
         self.color = update_data['color']
+        self.sprite.active = True
         if update_data['hit_points'] < self.hit_points:
             self.sprite.add_current_effect(ms=100, color=196)
         self.hit_points = update_data['hit_points']
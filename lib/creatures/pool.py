@@ -0,0 +1,44 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# removed entities kept per key at most
+MAX_FREE = 1000
+
+
+class EntityPool:
+    """
+    recycles removed entities instead of constructing new ones
+
+    entities are kept per key (e.g. the creature type), factory(key) builds a new one
+    when there is nothing to recycle
+    """
+
+    def __init__(self, factory, max_free=MAX_FREE):
+        self.factory = factory
+        self.max_free = max_free
+        self.free = {}
+
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, key=None):
+        free = self.free.get(key)
+        if free:
+            self.reused += 1
+            return free.pop()
+        self.created += 1
+        return self.factory(key)
+
+    def release(self, entity, key=None):
+        """
+        reset an entity and keep it for the next acquire with the same key
+
+        :param entity: needs a reset() method
+        :param key:
+        :return:
+        """
+        free = self.free.setdefault(key, [])
+        if len(free) < self.max_free:
+            entity.reset()
+            free.append(entity)
@@ -1,31 +1,92 @@
-from logging.config import dictConfig
-
-
-def init_logging(loglevel='info'):
-    dictConfig({
-
-        'version': 1,
-        'disable_existing_loggers': False,
-        'formatters': {
-            'default': {
-                'format': '%(name)s [%(filename)s][%(levelname)s][%(lineno)d] : %(message)s'
-            },
-        },
-        'handlers': {
-            'default': {
-                'level': loglevel.upper(),
-                'class': 'logging.FileHandler',
-                'formatter': 'default',
-                'filename': 'log.txt',
-                'mode': 'w',
-
-            },
-        },
-        'loggers': {
-            '': {
-                'handlers': ['default'],
-                'level': loglevel.upper(),
-                'propagate': True
-            },
-        }
-    })
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+LOG_FILE = 'log.txt'
+LOG_LEVELS = ('debug', 'info', 'warning', 'error')
+
+LOG_FORMAT = '%(name)s [%(filename)s][%(levelname)s][%(lineno)d] : %(message)s'
+
+# (loglevel, filename) of the current configuration
+_config = None
+_listener = None
+
+
+def init_logging(loglevel='info', filename=LOG_FILE):
+    """
+    configure the root logger
+
+    records are handed to a queue and written to the file by a background thread, so
+    logging never blocks the event loop on disk writes. Calling this again with the same
+    arguments does nothing, with other arguments it replaces the previous configuration
+
+    :param loglevel: one of LOG_LEVELS
+    :param filename: log file, None to turn logging off
+    :return:
+    """
+    global _config, _listener
+    if _config == (loglevel, filename):
+        return
+    stop_logging()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    if filename is None:
+        root.addHandler(logging.NullHandler())
+        # above every level, so isEnabledFor() is false everywhere
+        root.setLevel(logging.CRITICAL + 1)
+    else:
+        level = loglevel.upper()
+        file_handler = logging.FileHandler(filename, mode='w')
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        file_handler.setLevel(level)
+
+        queue = SimpleQueue()
+        root.addHandler(QueueHandler(queue))
+        root.setLevel(level)
+        _listener = QueueListener(queue, file_handler, respect_handler_level=True)
+        _listener.start()
+
+    _config = (loglevel, filename)
+
+
+def stop_logging():
+    """
+    write out queued records and stop the background thread
+
+    :return:
+    """
+    global _config, _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    _config = None
+
+
+atexit.register(stop_logging)
+
+
+class LogSample:
+    """
+    lets one in every `every` calls through, for logging in hot paths
+
+        if logger.isEnabledFor(logging.DEBUG) and update_sample():
+            logger.debug('update %s', data)
+    """
+    __slots__ = ('every', 'count')
+
+    def __init__(self, every):
+        self.every = every
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        if self.count >= self.every:
+            self.count = 0
+            return True
+        return False
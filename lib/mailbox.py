@@ -0,0 +1,122 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# packets merged into the pending state, everything else is applied as it comes
+MERGED_PACKETS = ('update', 'remove_players', 'remove_creatures')
+
+
+class PendingState:
+    """
+    merges the update and remove packets that arrived between two frames
+
+    last write wins per tile and per entity uid, removing an entity drops its pending update.
+    drain() turns the merged state back into packets, so applying it goes through the usual
+    handlers once per frame instead of once per packet
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # map payloads in arrival order as (is_tile_list, payload): consecutive tile lists are
+        # merged into one (x, y) -> tile dict, compact payloads (dicts) are kept as they are
+        self.map = []
+        self.self_data = None
+        self.players = {}
+        self.creatures = {}
+        self.removed_players = []
+        self.removed_creatures = []
+
+        # packets merged since the last drain
+        self.packets = 0
+
+    def __bool__(self):
+        return self.packets > 0
+
+    def merge(self, packet):
+        """
+        :param packet:
+        :return: False if the packet can not be merged and has to be applied on its own
+        """
+        packet_type = packet['type']
+        if packet_type not in MERGED_PACKETS:
+            return False
+
+        data = packet['data']
+        if packet_type == 'update':
+            self._merge_map(data.get('map'))
+            if data.get('self'):
+                if self.self_data is None:
+                    self.self_data = {}
+                self.self_data.update(data['self'])
+            self._merge_entities(self.players, data.get('players'))
+            self._merge_entities(self.creatures, data.get('creatures'))
+        elif packet_type == 'remove_players':
+            self._merge_removals(self.players, self.removed_players, data)
+        else:
+            self._merge_removals(self.creatures, self.removed_creatures, data)
+
+        self.packets += 1
+        return True
+
+    def _merge_map(self, map_data):
+        if not map_data:
+            return
+        if isinstance(map_data, dict):
+            self.map.append((False, map_data))
+            return
+        if not self.map or not self.map[-1][0]:
+            self.map.append((True, {}))
+        tiles = self.map[-1][1]
+        for tile in map_data:
+            (x, y), _, _ = tile
+            tiles[(x, y)] = tile
+
+    @staticmethod
+    def _merge_entities(pending, entities_data):
+        if not entities_data:
+            return
+        for uid, entity_data in entities_data.items():
+            merged = pending.get(uid)
+            if merged is None:
+                pending[uid] = dict(entity_data)
+            else:
+                merged.update(entity_data)
+
+    @staticmethod
+    def _merge_removals(pending, removed, uids):
+        for uid in uids:
+            pending.pop(uid, None)
+            removed.append(uid)
+
+    def drain(self):
+        """
+        the merged state as packets, in the order they have to be applied
+
+        removals come first: an entity removed and then updated again is spawned anew
+
+        :return: list of packets
+        """
+        packets = []
+        if self.removed_players:
+            packets.append({'type': 'remove_players', 'data': self.removed_players})
+        if self.removed_creatures:
+            packets.append({'type': 'remove_creatures', 'data': self.removed_creatures})
+        for is_tile_list, map_data in self.map:
+            if is_tile_list:
+                map_data = list(map_data.values())
+            packets.append({'type': 'update', 'data': {'map': map_data}})
+
+        data = {}
+        if self.self_data:
+            data['self'] = self.self_data
+        if self.players:
+            data['players'] = self.players
+        if self.creatures:
+            data['creatures'] = self.creatures
+        if data:
+            packets.append({'type': 'update', 'data': data})
+
+        self.clear()
+        return packets
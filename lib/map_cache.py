@@ -0,0 +1,259 @@
+"""
+on disk cache of the explored map, per server url and room
+
+a cache entry stores the tile types and seen bits of every explored chunk and the last
+position of the own player, so a restarted client draws the map it already knew while
+the init packet of the server is still on its way. Nothing is visible after loading, the
+server sends the field of view again
+
+the room is the 'room' of the init packet, servers that do not send one share a single
+room per url. Which room of a url was played last is kept next to the entries, so that
+it can be loaded before the server said anything
+
+an entry is a gzip stream of a magic, a length prefixed json header and then the tile ids
+(uint16) and seen rows (uint32) of every chunk listed in the header, little endian. Only
+data is read back, nothing in the cache directory can run code
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+from array import array
+
+from lib.room import CHUNK_AREA, CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+MAP_CACHE_DIR = '.map_cache'
+
+MAP_CACHE_MAGIC = b'ASCIIMAP'
+
+# bump when the layout of the cached map changes
+MAP_CACHE_VERSION = 2
+
+_LENGTH = struct.Struct('<I')
+_SEEN = struct.Struct('<%dI' % CHUNK_SIZE)
+_TILE_IDS_SIZE = 2 * CHUNK_AREA
+
+DEFAULT_ROOM = 'default'
+
+# seconds between saves while playing
+SAVE_INTERVAL = 10.0
+
+
+def _hash(*parts):
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def cache_path(url, room_name, cache_dir=MAP_CACHE_DIR):
+    return os.path.join(cache_dir, '%s.map.gz' % _hash(url, room_name))
+
+
+def last_room_path(url, cache_dir=MAP_CACHE_DIR):
+    return os.path.join(cache_dir, '%s.room' % _hash(url))
+
+
+def _tile_ids_bytes(tile_ids):
+    if sys.byteorder == 'big':
+        tile_ids = array('H', tile_ids)
+        tile_ids.byteswap()
+    return tile_ids.tobytes()
+
+
+def _tile_ids_from_bytes(data):
+    tile_ids = array('H')
+    tile_ids.frombytes(data)
+    if sys.byteorder == 'big':
+        tile_ids.byteswap()
+    return tile_ids
+
+
+def read_entry(f):
+    """
+    :param f: file opened for reading bytes
+    :return: the entry as returned by MapCache.snapshot
+    """
+    if f.read(len(MAP_CACHE_MAGIC)) != MAP_CACHE_MAGIC:
+        raise ValueError('not a map cache')
+    length, = _LENGTH.unpack(f.read(_LENGTH.size))
+    entry = json.loads(f.read(length))
+    if entry.get('version') != MAP_CACHE_VERSION:
+        return entry
+    chunks = {}
+    for chunk_x, chunk_y in entry['chunks']:
+        tile_ids = f.read(_TILE_IDS_SIZE)
+        seen = f.read(_SEEN.size)
+        if len(tile_ids) < _TILE_IDS_SIZE or len(seen) < _SEEN.size:
+            raise ValueError('truncated')
+        chunks[(int(chunk_x), int(chunk_y))] = (_tile_ids_from_bytes(tile_ids), _SEEN.unpack(seen))
+    entry['chunks'] = chunks
+    return entry
+
+
+def write_entry(f, entry):
+    """
+    :param f: file opened for writing bytes
+    :param entry: from MapCache.snapshot
+    :return:
+    """
+    chunks = entry['chunks']
+    header = dict(entry, chunks=list(chunks))
+    header_data = json.dumps(header).encode()
+    f.write(MAP_CACHE_MAGIC + _LENGTH.pack(len(header_data)) + header_data)
+    for tile_ids, seen in chunks.values():
+        f.write(_tile_ids_bytes(tile_ids))
+        f.write(_SEEN.pack(*seen))
+
+
+def _write_atomic(path, write):
+    # the periodic save runs in the executor and may overlap with the one at exit
+    tmp = '%s.%s.%s.tmp' % (path, os.getpid(), threading.get_ident())
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class MapCache:
+    def __init__(self, url, cache_dir=MAP_CACHE_DIR):
+        self.url = url
+        self.cache_dir = cache_dir
+        # room the current Room holds the tiles of, None before load or enter
+        self.room_name = None
+        # sum of the chunk versions at the last save, to skip saving an unchanged room
+        self.saved_version = None
+
+    def load(self, room, player=None, room_name=None):
+        """
+        add the cached chunks of a room to a Room
+
+        :param room: Room
+        :param player: gets the cached position, if any
+        :param room_name: None for the room of this url played last
+        :return: number of chunks loaded
+        """
+        if room_name is None:
+            room_name = self.last_room()
+        self.room_name = room_name
+        self.saved_version = None
+        path = cache_path(self.url, room_name, self.cache_dir)
+        try:
+            with gzip.open(path, 'rb') as f:
+                entry = read_entry(f)
+            if entry.get('version') != MAP_CACHE_VERSION or entry['url'] != self.url \
+                    or entry['room'] != room_name:
+                logger.info('map cache %s is outdated', path)
+                return 0
+            loaded = room.restore_chunks(entry['tile_names'], entry['chunks'])
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.warning('could not read map cache %s: %s', path, e)
+            return 0
+
+        if player is not None and entry.get('player'):
+            player.x, player.y = map(int, entry['player'])
+        logger.info('loaded %d chunks of %s from the map cache', loaded, room_name)
+        return loaded
+
+    def last_room(self):
+        try:
+            with open(last_room_path(self.url, self.cache_dir), encoding='utf-8') as f:
+                return f.read().strip() or DEFAULT_ROOM
+        except OSError:
+            return DEFAULT_ROOM
+
+    def enter(self, room, room_name, player=None):
+        """
+        switch to the room the server put us in
+
+        tiles of another room are saved and dropped, then the cache of the new room is loaded
+
+        :param room: Room
+        :param room_name: from the init packet, None if the server does not name rooms
+        :param player:
+        :return: True if the room changed
+        """
+        room_name = room_name or DEFAULT_ROOM
+        if room_name == self.room_name:
+            return False
+        if self.room_name is not None:
+            self.write(self.snapshot(room, player))
+        room.clear()
+        self.load(room, player, room_name)
+        return True
+
+    def snapshot(self, room, player=None):
+        """
+        copy what is saved, cheap enough for the event loop, see write
+
+        :return: the cache entry or None if nothing changed since the last snapshot
+        """
+        version = sum(chunk.version for chunk in room.chunks.values())
+        if self.room_name is None or version == self.saved_version:
+            return None
+        self.saved_version = version
+        return {
+            'version': MAP_CACHE_VERSION,
+            'url': self.url,
+            'room': self.room_name,
+            'tile_names': list(room.tile_names),
+            'chunks': room.explored_chunks(),
+            'player': (player.x, player.y) if player is not None else None,
+        }
+
+    def write(self, entry):
+        """
+        compress and write a snapshot, failures are only logged. Can run in another thread
+
+        :param entry: from snapshot, None does nothing
+        :return: True if the entry was written
+        """
+        if entry is None:
+            return False
+
+        def write_compressed(tmp):
+            with gzip.open(tmp, 'wb', compresslevel=6) as f:
+                write_entry(f, entry)
+
+        def write_room(tmp):
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(entry['room'])
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            _write_atomic(cache_path(self.url, entry['room'], self.cache_dir), write_compressed)
+            _write_atomic(last_room_path(self.url, self.cache_dir), write_room)
+        except OSError as e:
+            logger.warning('could not write map cache: %s', e)
+            return False
+        logger.debug('saved %d chunks of %s to the map cache', len(entry['chunks']), entry['room'])
+        return True
+
+
+async def save_map_cache(cache, room, player=None, interval=SAVE_INTERVAL):
+    """
+    save the room every interval seconds, compressing and writing in the default executor
+
+    :param cache: MapCache
+    :param room: Room
+    :param player:
+    :param interval:
+    :return:
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(interval)
+        entry = cache.snapshot(room, player)
+        if entry is not None:
+            await loop.run_in_executor(None, cache.write, entry)
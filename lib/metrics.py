@@ -0,0 +1,98 @@
+import asyncio
+import json
+import logging
+import time
+
+from lib.stats import Samples
+
+logger = logging.getLogger(__name__)
+
+# parts of a frame that are timed separately
+SECTIONS = ('poll', 'tick', 'map', 'entities', 'flush')
+
+
+class Metrics:
+    """
+    counters and timings of the client, read by the overlay and the metrics file
+    """
+
+    def __init__(self):
+        # seconds per frame (apply packets, tick, draw) and from receiving a packet to drawing it
+        self.frame_times = Samples()
+        self.packet_latency = Samples()
+        # seconds to decode one packet
+        self.decode_times = Samples()
+        self.sections = {name: Samples() for name in SECTIONS}
+
+        self.frames = 0
+        self.rendered_frames = 0
+        self.packets = 0
+
+        # entities ticked and skipped (out of view) in the last frame
+        self.ticked_entities = 0
+        self.skipped_entities = 0
+
+        # callable returning a dict of counts (entities, tiles, ...) for snapshots
+        self.counts = None
+
+    def add_section(self, name, seconds):
+        self.sections[name].add(seconds)
+
+    def snapshot(self, previous=None):
+        """
+        current values as a json serialisable dict
+
+        :param previous: an earlier snapshot, rates are computed since then
+        :return:
+        """
+        now = time.monotonic()
+        snapshot = {
+            'time': time.time(),
+            'monotonic': now,
+            'frames_total': self.frames,
+            'rendered_total': self.rendered_frames,
+            'packets_total': self.packets,
+            'ticked_entities': self.ticked_entities,
+            'skipped_entities': self.skipped_entities,
+        }
+        if previous is not None and now > previous['monotonic']:
+            elapsed = now - previous['monotonic']
+            snapshot['fps'] = (self.rendered_frames - previous['rendered_total']) / elapsed
+            snapshot['ticks_per_s'] = (self.frames - previous['frames_total']) / elapsed
+            snapshot['packets_per_s'] = (self.packets - previous['packets_total']) / elapsed
+
+        for name, samples in (('frame_ms', self.frame_times), ('latency_ms', self.packet_latency)):
+            p50, p99 = samples.percentiles(50, 99)
+            snapshot[name] = None if p50 is None else {'p50': p50 * 1000, 'p99': p99 * 1000}
+
+        decode_p50, = self.decode_times.percentiles(50)
+        snapshot['decode_us_p50'] = None if decode_p50 is None else decode_p50 * 1e6
+
+        split = {}
+        for name, samples in self.sections.items():
+            p50, = samples.percentiles(50)
+            split[name] = None if p50 is None else p50 * 1000
+        snapshot['section_ms_p50'] = split
+
+        if self.counts is not None:
+            snapshot.update(self.counts())
+        return snapshot
+
+
+async def write_metrics(metrics, path, interval=1.0):
+    """
+    append a snapshot as a json line every interval seconds
+
+    :param metrics:
+    :param path:
+    :param interval:
+    :return:
+    """
+    previous = metrics.snapshot()
+    with open(path, 'a') as f:
+        while True:
+            await asyncio.sleep(interval)
+            snapshot = metrics.snapshot(previous)
+            f.write(json.dumps(snapshot) + '\n')
+            f.flush()
+            previous = snapshot
@@ -0,0 +1,410 @@
+"""
+stand-in game server with synthetic load
+
+speaks the protocol of the real server: init on connect, then update, remove_players and
+remove_creatures packets at a fixed rate, and takes actions from the client. Every packet
+carries the tick it was sent in, a client connecting with resume=TICK gets the entities and
+what was removed since then instead of the whole map, as long as the tick is recent. The
+world is a walled map with wandering creatures and bot players, every knob of the load is
+an argument of MockWorld and MockServer
+
+    python main.py serve --map-size 500 --creatures 2000 --packet-rate 20
+"""
+import asyncio
+import base64
+import logging
+import random
+import time
+import uuid
+from collections import deque
+
+from aiohttp import web, WSMsgType
+
+from lib.codec import JsonCodec, get_codec
+from lib.creatures.motion import MOVES
+
+logger = logging.getLogger(__name__)
+
+CREATURE_TYPES = ('blob', 'skeleton')
+
+# radius around each connected player that is sent as visible
+VIEW_RADIUS = 8
+
+# seconds between the load reports in the log
+REPORT_INTERVAL = 5.0
+
+# seconds of removals kept to resume clients from
+RESUME_WINDOW = 30.0
+
+
+class MockWorld:
+    def __init__(self, map_size=200, creature_count=500, player_count=10, move_rate=1.0, churn=0.0, seed=None):
+        """
+        :param map_size: the map is map_size x map_size tiles
+        :param creature_count: creatures alive at any time
+        :param player_count: bot players, connected clients come on top
+        :param move_rate: moves per second of every creature and bot
+        :param churn: creatures despawned (and as many spawned) per second
+        :param seed: for the random generator
+        """
+        self.rnd = random.Random(seed)
+        self.map_size = map_size
+        # the map only depends on its size
+        self.room = 'mock-%d' % map_size
+        self.move_rate = move_rate
+        self.churn = churn
+
+        # uid -> packet data, changed entries are collected in the dirty sets until the next tick
+        self.creatures = {}
+        self.players = {}
+        self.dirty_creatures = set()
+        self.dirty_players = set()
+        self.removed_creatures = []
+        self.removed_players = []
+
+        # fractions of a move or spawn carried over to the next tick
+        self.pending_moves = 0.0
+        self.pending_churn = 0.0
+
+        self.bots = []
+        for _ in range(creature_count):
+            self.spawn_creature()
+        for _ in range(player_count):
+            self.bots.append(self.add_player())
+
+    def is_wall(self, x, y):
+        size = self.map_size
+        if x <= 0 or y <= 0 or x >= size - 1 or y >= size - 1:
+            return True
+        # pillars in a regular pattern, with gaps to walk through
+        return x % 12 == 0 and y % 12 < 8
+
+    def free_cell(self):
+        while True:
+            x = self.rnd.randrange(1, self.map_size - 1)
+            y = self.rnd.randrange(1, self.map_size - 1)
+            if not self.is_wall(x, y):
+                return [x, y]
+
+    def map_runs(self):
+        """
+        the whole map as compact row runs, all seen and nothing visible
+
+        :return: map payload
+        """
+        runs = []
+        for y in range(self.map_size):
+            row = []
+            last = None
+            for x in range(self.map_size):
+                name = 'wall' if self.is_wall(x, y) else 'floor'
+                if name == last:
+                    row[-1][1] += 1
+                else:
+                    row.append([name, 1, True, False])
+                    last = name
+            runs.append([0, y, row])
+        return {'runs': runs}
+
+    def visibility(self, x, y, radius=VIEW_RADIUS):
+        """
+        field of view of a circle around x, y
+
+        sent as 'fov', which also clears everything visible before, so the rect is just the
+        bounding box of the circle, clipped to the map
+
+        :return: [x, y, width, height, base64 mask]
+        """
+        x0, y0 = max(0, x - radius), max(0, y - radius)
+        x1, y1 = min(self.map_size, x + radius + 1), min(self.map_size, y + radius + 1)
+        width, height = x1 - x0, y1 - y0
+        mask = bytearray((width * height + 7) // 8)
+        bit = 0
+        for cell_y in range(y0, y1):
+            for cell_x in range(x0, x1):
+                if (cell_x - x) ** 2 + (cell_y - y) ** 2 <= radius * radius:
+                    mask[bit >> 3] |= 1 << (bit & 7)
+                bit += 1
+        return [x0, y0, width, height, base64.b64encode(bytes(mask)).decode()]
+
+    def spawn_creature(self):
+        uid = str(uuid.UUID(int=self.rnd.getrandbits(128)))
+        self.creatures[uid] = {
+            'type': self.rnd.choice(CREATURE_TYPES),
+            'coords': self.free_cell(),
+            'color': self.rnd.randrange(1, 255),
+            'is_visible': True,
+        }
+        self.dirty_creatures.add(uid)
+        return uid
+
+    def add_player(self):
+        uid = str(uuid.UUID(int=self.rnd.getrandbits(128)))
+        self.players[uid] = {
+            'coords': self.free_cell(),
+            'color': self.rnd.randrange(1, 255),
+            'hit_points': 100,
+        }
+        self.dirty_players.add(uid)
+        return uid
+
+    def remove_player(self, uid):
+        if self.players.pop(uid, None) is not None:
+            self.dirty_players.discard(uid)
+            self.removed_players.append(uid)
+
+    def move(self, entity, action):
+        """
+        :return: True if the entity moved
+        """
+        dx, dy = MOVES[action]
+        x, y = entity['coords']
+        if self.is_wall(x + dx, y + dy):
+            return False
+        entity['coords'] = [x + dx, y + dy]
+        return True
+
+    def move_player(self, uid, action):
+        if action in MOVES and self.move(self.players[uid], action):
+            self.dirty_players.add(uid)
+
+    def tick(self, dt):
+        """
+        wander and churn for dt seconds, the changes are collected for the next packets
+
+        :param dt:
+        :return:
+        """
+        rnd = self.rnd
+        actions = list(MOVES)
+
+        creature_uids = list(self.creatures)
+        self.pending_moves += (len(creature_uids) + len(self.bots)) * self.move_rate * dt
+        moves = int(self.pending_moves)
+        self.pending_moves -= moves
+        for _ in range(moves):
+            idx = rnd.randrange(len(creature_uids) + len(self.bots))
+            if idx < len(creature_uids):
+                uid = creature_uids[idx]
+                if self.move(self.creatures[uid], rnd.choice(actions)):
+                    self.dirty_creatures.add(uid)
+            else:
+                self.move_player(self.bots[idx - len(creature_uids)], rnd.choice(actions))
+
+        self.pending_churn += self.churn * dt
+        churn = min(int(self.pending_churn), len(self.creatures))
+        self.pending_churn -= churn
+        for uid in rnd.sample(list(self.creatures), churn):
+            del self.creatures[uid]
+            self.dirty_creatures.discard(uid)
+            self.removed_creatures.append(uid)
+        for _ in range(churn):
+            self.spawn_creature()
+
+    def collect(self):
+        """
+        the changes since the last collect
+
+        :return: dict with changed players and creatures and removed uids
+        """
+        changes = {
+            'players': {uid: self.players[uid] for uid in self.dirty_players},
+            'creatures': {uid: self.creatures[uid] for uid in self.dirty_creatures},
+            'remove_players': self.removed_players,
+            'remove_creatures': self.removed_creatures,
+        }
+        self.dirty_players = set()
+        self.dirty_creatures = set()
+        self.removed_players = []
+        self.removed_creatures = []
+        return changes
+
+
+class MockSession:
+    def __init__(self, ws, uid):
+        self.ws = ws
+        # the player of this client in the world
+        self.uid = uid
+        self.codec = get_codec(JsonCodec.name)
+        self.last_coords = None
+
+    async def send(self, packet_type, data, tick):
+        payload = self.codec.encode({'type': packet_type, 'data': data, 'tick': tick})
+        if self.codec.binary:
+            await self.ws.send_bytes(payload)
+        else:
+            await self.ws.send_str(payload)
+        return len(payload)
+
+    def negotiate(self, offered):
+        """
+        pick the first offered binary encoding available here
+
+        :return: the codec name or None
+        """
+        for name in offered:
+            try:
+                codec = get_codec(name)
+            except ValueError:
+                continue
+            if codec.binary:
+                return name
+        return None
+
+
+class MockServer:
+    def __init__(self, world, packet_rate=20):
+        """
+        :param world: MockWorld
+        :param packet_rate: update packets per second sent to each client
+        """
+        self.world = world
+        self.packet_rate = packet_rate
+        self.sessions = {}
+        # clients always send json text
+        self.text_codec = get_codec(JsonCodec.name)
+
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.actions_received = 0
+
+        # number of broadcasts so far
+        self.tick = 0
+        # (tick, removed player uids, removed creature uids) of the recent broadcasts
+        self.removals = deque(maxlen=max(1, int(RESUME_WINDOW * packet_rate)))
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get('/', self.handle_ws)
+        app.on_startup.append(self.start_ticking)
+        return app
+
+    async def start_ticking(self, app):
+        app['ticker'] = asyncio.ensure_future(self.run())
+
+    async def handle_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        world = self.world
+        session = MockSession(ws, world.add_player())
+        self.sessions[session.uid] = session
+        logger.info('client %s connected as %s', request.remote, session.uid)
+
+        player_data = world.players[session.uid]
+        session.last_coords = list(player_data['coords'])
+        state = {
+            'map': {'fov': world.visibility(*player_data['coords'])},
+            'self': player_data,
+            'players': {uid: data for uid, data in world.players.items() if uid != session.uid},
+            'creatures': world.creatures,
+        }
+        removed = self.removed_since(request.query.get('resume'))
+        if removed is None:
+            state['map'].update(world.map_runs())
+            state['room'] = world.room
+            await self.send(session, 'init', state)
+        else:
+            # the client still has the map
+            removed_players, removed_creatures = removed
+            logger.info('resuming %s from tick %s', session.uid, request.query['resume'])
+            if removed_players:
+                await self.send(session, 'remove_players', removed_players)
+            if removed_creatures:
+                await self.send(session, 'remove_creatures', removed_creatures)
+            await self.send(session, 'update', state)
+        # the first packets already have everything
+        world.dirty_players.discard(session.uid)
+
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                packet = self.text_codec.decode(msg.data)
+                if packet['type'] == 'actions':
+                    self.actions_received += len(packet['data'])
+                    for action in packet['data']:
+                        world.move_player(session.uid, action)
+                elif packet['type'] == 'encodings':
+                    name = session.negotiate(packet['data'])
+                    if name:
+                        await self.send(session, 'encoding', name)
+                        session.codec = get_codec(name)
+                        logger.info('%s uses %s', session.uid, name)
+        finally:
+            del self.sessions[session.uid]
+            world.remove_player(session.uid)
+            logger.info('%s disconnected', session.uid)
+        return ws
+
+    def removed_since(self, tick):
+        """
+        :param tick: resume parameter of a connecting client
+        :return: (removed player uids, removed creature uids) since the tick, None if the
+            client can not be resumed from there
+        """
+        try:
+            tick = int(tick)
+        except (TypeError, ValueError):
+            return None
+        oldest = self.removals[0][0] if self.removals else self.tick
+        if not oldest - 1 <= tick <= self.tick:
+            return None
+        removed_players = []
+        removed_creatures = []
+        for removal_tick, players, creatures in self.removals:
+            if removal_tick > tick:
+                removed_players.extend(players)
+                removed_creatures.extend(creatures)
+        return removed_players, removed_creatures
+
+    async def send(self, session, packet_type, data):
+        try:
+            self.bytes_sent += await session.send(packet_type, data, self.tick)
+        except ConnectionError as e:
+            logger.info('sending to %s failed: %s', session.uid, e)
+            return
+        self.packets_sent += 1
+
+    async def broadcast(self, changes):
+        world = self.world
+        self.tick += 1
+        self.removals.append((self.tick, changes['remove_players'], changes['remove_creatures']))
+        for uid, session in list(self.sessions.items()):
+            player_data = world.players.get(uid)
+            if player_data is None:
+                continue
+            data = {
+                'players': {other: data for other, data in changes['players'].items() if other != uid},
+                'creatures': changes['creatures'],
+            }
+            if uid in changes['players']:
+                data['self'] = player_data
+                if player_data['coords'] != session.last_coords:
+                    data['map'] = {'fov': world.visibility(*player_data['coords'])}
+                    session.last_coords = list(player_data['coords'])
+            await self.send(session, 'update', data)
+            if changes['remove_creatures']:
+                await self.send(session, 'remove_creatures', changes['remove_creatures'])
+            if changes['remove_players']:
+                await self.send(session, 'remove_players', changes['remove_players'])
+
+    async def run(self):
+        interval = 1 / self.packet_rate
+        last = time.monotonic()
+        last_report = last
+        packets, bytes_sent = self.packets_sent, self.bytes_sent
+        while True:
+            await asyncio.sleep(max(0.0, last + interval - time.monotonic()))
+            now = time.monotonic()
+            self.world.tick(now - last)
+            last = now
+            await self.broadcast(self.world.collect())
+
+            if now - last_report >= REPORT_INTERVAL:
+                elapsed = now - last_report
+                logger.info('%d clients, %.1f packets/s, %.1f KiB/s, %d actions',
+                            len(self.sessions), (self.packets_sent - packets) / elapsed,
+                            (self.bytes_sent - bytes_sent) / elapsed / 1024, self.actions_received)
+                last_report = now
+                packets, bytes_sent = self.packets_sent, self.bytes_sent
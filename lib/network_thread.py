@@ -0,0 +1,110 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+
+import aiohttp
+
+from lib.reconnect import Backoff, connect_with_backoff
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+logger = logging.getLogger(__name__)
+
+
+def new_event_loop(use_uvloop=False):
+    if use_uvloop:
+        if uvloop is None:
+            raise RuntimeError('uvloop is not installed')
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+class NetworkThread(threading.Thread):
+    """
+    owns the websocket in an event loop of its own
+
+    every message is passed to on_message in this thread (which decodes it), when that
+    returns True notify is called in the event loop of the renderer. If the websocket
+    drops after the first connection, it is opened again with an exponential backoff
+    """
+
+    def __init__(self, get_url, on_message, notify_loop, notify, handshake=None, reconnect=True,
+                 use_uvloop=False):
+        """
+        :param get_url: returns the url for every connection attempt
+        :param on_message:
+        :param notify_loop:
+        :param notify:
+        :param handshake: returns the text messages sent first on every connection
+        :param reconnect: False to stop after the websocket dropped
+        :param use_uvloop:
+        """
+        super().__init__(name='network', daemon=True)
+        self.get_url = get_url
+        self.on_message = on_message
+        self.notify_loop = notify_loop
+        self.notify = notify
+        self.handshake = handshake
+        self.reconnect = reconnect
+        self.use_uvloop = use_uvloop
+
+        self.loop = None
+        self.ws = None
+
+        # resolved when the websocket is open, or failed to open
+        self.connected = concurrent.futures.Future()
+
+    def run(self):
+        self.loop = new_event_loop(self.use_uvloop)
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._run())
+        except Exception as e:
+            logger.exception('network thread stopped')
+            if not self.connected.done():
+                self.connected.set_exception(e)
+        finally:
+            self.loop.close()
+
+    async def _run(self):
+        async with aiohttp.ClientSession() as session:
+            await self._connect(session)
+            self.connected.set_result(True)
+            backoff = Backoff()
+            while True:
+                try:
+                    async for msg in self.ws:
+                        if self.on_message(msg):
+                            backoff.reset()
+                            self.notify_loop.call_soon_threadsafe(self.notify)
+                except (aiohttp.ClientError, ConnectionError) as e:
+                    logger.warning('connection lost: %s', e)
+                if not self.reconnect:
+                    logger.warning('disconnected')
+                    return
+                await connect_with_backoff(lambda: self._connect(session), backoff)
+
+    async def _connect(self, session):
+        url = self.get_url()
+        self.ws = await session.ws_connect(url)
+        logger.info('connected to %s', url)
+        if self.handshake:
+            for data in self.handshake():
+                await self.ws.send_str(data)
+
+    @property
+    def is_connected(self):
+        return self.ws is not None and not self.ws.closed
+
+    def send_str(self, data):
+        """
+        send from any thread
+
+        :param data:
+        :return: concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(self.ws.send_str(data), self.loop)
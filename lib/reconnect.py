@@ -0,0 +1,82 @@
+"""
+reconnecting after the websocket dropped
+
+the client keeps its room and entities while it is disconnected. Every connection after
+the first asks the server to resume from the last tick the client received, with a
+resume=TICK query parameter: a server that can resume only sends what changed since then,
+any other server ignores the parameter and sends a full init packet
+"""
+import asyncio
+import logging
+import random
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# seconds before the first reconnect attempt, doubled after every failed one
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 30.0
+
+
+class Backoff:
+    def __init__(self, initial=RECONNECT_DELAY, maximum=MAX_RECONNECT_DELAY, factor=2.0, jitter=0.2):
+        """
+        :param initial: seconds of the first delay
+        :param maximum: delays do not grow beyond this, before the jitter
+        :param factor: growth of the delay per attempt
+        :param jitter: fraction of the delay added at random, so that many clients dropped
+            at the same time do not all come back at once
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self):
+        """
+        :return: seconds to wait before the next attempt
+        """
+        delay = min(self.initial * self.factor ** self.attempts, self.maximum)
+        if delay < self.maximum:
+            self.attempts += 1
+        return delay * (1 + random.random() * self.jitter)
+
+    def reset(self):
+        # connected again, the next drop starts over with the initial delay
+        self.attempts = 0
+
+
+def resume_url(url, tick):
+    """
+    :param url: websocket url of the server
+    :param tick: last tick received, None to start over
+    :return: the url to connect to
+    """
+    if tick is None:
+        return url
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key != 'resume']
+    query.append(('resume', str(tick)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+async def connect_with_backoff(connect, backoff):
+    """
+    wait and try again until connect succeeds, the delay grows after every failure
+
+    :param connect: coroutine function opening the websocket
+    :param backoff: Backoff
+    :return:
+    """
+    while True:
+        delay = backoff.next_delay()
+        logger.warning('disconnected, reconnecting in %.1f s', delay)
+        await asyncio.sleep(delay)
+        try:
+            await connect()
+            return
+        except (aiohttp.ClientError, OSError) as e:
+            logger.warning('reconnect failed: %s', e)
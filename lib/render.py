@@ -0,0 +1,270 @@
+import logging
+
+from asciimatics.screen import Screen
+
+from lib.room import CHUNK_SHIFT, CHUNK_SIZE, ROW_BITS
+
+logger = logging.getLogger(__name__)
+
+# what clear_buffer leaves in a cell: char, colour (white), attr (normal), bg (black)
+BLANK = (' ', 7, 0, 0)
+
+
+class FrameComposer:
+    """
+    composes a frame offscreen and only sends the cells that changed to the screen
+
+    the screen buffer is never cleared between frames, so every cell printed in the previous
+    frame is either printed again with new content or blanked in flush()
+    """
+
+    def __init__(self, screen, coalesce=True):
+        self.screen = screen
+        # print runs of same styled cells with one print_at instead of one call per cell
+        self.coalesce = coalesce
+        self.width = 0
+        self.height = 0
+
+        # flat, row major lists of cells, None for blank cells
+        self.previous = []
+        self.current = []
+
+        self.full_redraw = True
+
+        # print_at calls of the last flush
+        self.print_calls = 0
+
+    def begin(self):
+        """
+        start a new, empty frame
+
+        :return:
+        """
+        if self.screen.width != self.width or self.screen.height != self.height:
+            self.width = self.screen.width
+            self.height = self.screen.height
+            self.previous = [None] * (self.width * self.height)
+            self.full_redraw = True
+        self.current = [None] * (self.width * self.height)
+
+    def put(self, char, x, y, colour=7, attr=0, bg=0):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.current[y * self.width + x] = (char, colour, attr, bg)
+
+    def put_string(self, s, x, y, colour=7, attr=0, bg=0):
+        if not 0 <= y < self.height:
+            return
+        row = y * self.width
+        for char in s:
+            if 0 <= x < self.width:
+                self.current[row + x] = (char, colour, attr, bg)
+            x += 1
+
+    def blit_row(self, cells, x, y):
+        """
+        copy a row of cells (None for blank) into the frame
+
+        :param cells: list of cells
+        :param x: screen column of the first cell
+        :param y: screen row
+        :return:
+        """
+        if not 0 <= y < self.height:
+            return
+        start = max(-x, 0)
+        end = min(len(cells), self.width - x)
+        if start < end:
+            row = y * self.width
+            self.current[row + x + start:row + x + end] = cells[start:end]
+
+    def flush(self):
+        """
+        print the cells that differ from the previous frame and refresh the screen
+
+        the refresh is skipped if nothing changed
+
+        :return: number of cells printed
+        """
+        if self.full_redraw:
+            self.screen.clear_buffer(*BLANK[1:])
+            self.previous = [None] * (self.width * self.height)
+            self.full_redraw = False
+        elif self.current == self.previous:
+            self.print_calls = 0
+            return 0
+
+        if self.coalesce:
+            changed = self._print_runs()
+        else:
+            changed = self._print_cells()
+
+        self.previous = self.current
+        if changed:
+            self.screen.refresh()
+        return changed
+
+    def _print_cells(self):
+        screen = self.screen
+        width = self.width
+        changed = 0
+        for idx, (old, new) in enumerate(zip(self.previous, self.current)):
+            if old != new:
+                char, colour, attr, bg = new or BLANK
+                screen.print_at(char, idx % width, idx // width, colour=colour, attr=attr, bg=bg)
+                changed += 1
+        self.print_calls = changed
+        return changed
+
+    def _print_runs(self):
+        """
+        print horizontal runs of changed cells with the same colour, attr and bg as one string
+
+        :return: number of cells printed
+        """
+        screen = self.screen
+        width = self.width
+        previous = self.previous
+        current = self.current
+        changed = 0
+        calls = 0
+        for y in range(self.height):
+            row = y * width
+            old_row = previous[row:row + width]
+            new_row = current[row:row + width]
+            if old_row == new_row:
+                continue
+            x = 0
+            while x < width:
+                if new_row[x] == old_row[x]:
+                    x += 1
+                    continue
+                start = x
+                char, colour, attr, bg = new_row[x] or BLANK
+                chars = [char]
+                x += 1
+                while x < width and new_row[x] != old_row[x]:
+                    next_char, next_colour, next_attr, next_bg = new_row[x] or BLANK
+                    if next_colour != colour or next_attr != attr or next_bg != bg:
+                        break
+                    chars.append(next_char)
+                    x += 1
+                screen.print_at(''.join(chars), start, y, colour=colour, attr=attr, bg=bg)
+                changed += len(chars)
+                calls += 1
+        self.print_calls = calls
+        return changed
+
+
+class MapLayer:
+    """
+    pre-rasterised cells of the room
+
+    every chunk of the room is rendered once into a flat list of cells and only rendered
+    again after update_room wrote to it (the chunk version changed). When tile ids get new
+    names (names_version of the room changed, e.g. the room was cleared) the glyph tables
+    are built again and every cached chunk is dropped.
+    Rows are rendered from the seen / visible bitsets of the chunk: rows that are all
+    visible, all seen or all unseen are looked up for the whole row at once, only mixed
+    rows go cell by cell
+    """
+
+    def __init__(self, room, glyphs):
+        self.room = room
+        self.glyphs = glyphs
+
+        # (chunk_x, chunk_y) -> (chunk, chunk version, cells)
+        self.rasters = {}
+
+        # tile id -> cell of a visible tile / of a tile seen before, built for names_version
+        self._visible_lut = []
+        self._seen_lut = []
+        self._names_version = None
+
+    def _check_names(self):
+        if self._names_version == self.room.names_version:
+            return
+        # cached cells hold glyphs of the old tile ids, after a clear also chunks the room dropped
+        self._build_lut()
+        self.rasters.clear()
+
+    def _build_lut(self):
+        self._names_version = self.room.names_version
+        self._visible_lut = []
+        self._seen_lut = []
+        for name in self.room.tile_names:
+            glyph = self.glyphs.get(name)
+            if glyph is None:
+                self._visible_lut.append(None)
+                self._seen_lut.append(None)
+            else:
+                self._visible_lut.append((glyph, Screen.COLOUR_WHITE, 0, 0))
+                self._seen_lut.append((glyph, Screen.COLOUR_MAGENTA, 0, 0))
+
+    def _rasterise(self, chunk):
+        visible_lut = self._visible_lut
+        seen_lut = self._seen_lut
+        blank_row = [None] * CHUNK_SIZE
+        cells = []
+        for row in range(CHUNK_SIZE):
+            seen = chunk.seen[row]
+            if not seen:
+                cells += blank_row
+                continue
+            visible = chunk.visible[row]
+            start = row << CHUNK_SHIFT
+            ids = chunk.tile_ids[start:start + CHUNK_SIZE]
+            if visible == ROW_BITS:
+                cells += [visible_lut[tile_id] for tile_id in ids]
+            elif seen == ROW_BITS and not visible:
+                cells += [seen_lut[tile_id] for tile_id in ids]
+            else:
+                cells += [
+                    None if not seen >> col & 1 else
+                    visible_lut[tile_id] if visible >> col & 1 else seen_lut[tile_id]
+                    for col, tile_id in enumerate(ids)
+                ]
+        return cells
+
+    def chunk_cells(self, key):
+        """
+        rasterised cells of a chunk, rendered again if the chunk changed
+
+        :param key: (chunk_x, chunk_y)
+        :return: list of CHUNK_AREA cells or None if the room has no such chunk
+        """
+        # before the lookup, so the first frame after a clear drops the old chunks even
+        # where the new room has none
+        self._check_names()
+        chunk = self.room.chunks.get(key)
+        if chunk is None:
+            return None
+        cached = self.rasters.get(key)
+        if cached is not None and cached[0] is chunk and cached[1] == chunk.version:
+            return cached[2]
+        cells = self._rasterise(chunk)
+        self.rasters[key] = (chunk, chunk.version, cells)
+        return cells
+
+    def blit(self, frame, x0, y0):
+        """
+        draw the map into a frame
+
+        :param frame: FrameComposer, already begun
+        :param x0: map x shown in the leftmost screen column
+        :param y0: map y shown in the top screen row
+        :return:
+        """
+        x1 = x0 + frame.width
+        y1 = y0 + frame.height
+        for chunk_y in range(y0 >> CHUNK_SHIFT, ((y1 - 1) >> CHUNK_SHIFT) + 1):
+            base_y = chunk_y << CHUNK_SHIFT
+            row_start = max(y0 - base_y, 0)
+            row_end = min(y1 - base_y, CHUNK_SIZE)
+            for chunk_x in range(x0 >> CHUNK_SHIFT, ((x1 - 1) >> CHUNK_SHIFT) + 1):
+                cells = self.chunk_cells((chunk_x, chunk_y))
+                if cells is None:
+                    continue
+                screen_x = (chunk_x << CHUNK_SHIFT) - x0
+                for row in range(row_start, row_end):
+                    start = row << CHUNK_SHIFT
+                    frame.blit_row(cells[start:start + CHUNK_SIZE], screen_x, base_y + row - y0)
@@ -0,0 +1,314 @@
+import base64
+import logging
+from array import array
+
+logger = logging.getLogger(__name__)
+
+# tiles are stored in square chunks of CHUNK_SIZE x CHUNK_SIZE
+CHUNK_SHIFT = 5
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+CHUNK_AREA = CHUNK_SIZE * CHUNK_SIZE
+# all bits of a row of a chunk
+ROW_BITS = (1 << CHUNK_SIZE) - 1
+# a zeroed bitset of a chunk
+_NO_BITS = bytes(array('L').itemsize * CHUNK_SIZE)
+
+# tile id of cells the server never sent
+NO_TILE = 0
+
+
+class Tile:
+    def __init__(self, name, seen, is_visible):
+        self.name = name
+        self.seen = seen
+        self.is_visible = is_visible
+
+
+class Chunk:
+    """
+    CHUNK_SIZE x CHUNK_SIZE tiles, row major
+
+    tile_ids index into Room.tile_names. seen / visible are bitsets, one int per row with
+    bit n for column n, so a whole row is read or written with one bitwise operation.
+    Visible tiles are always seen. version is bumped on every write so cached renderings
+    of the chunk can be invalidated
+    """
+    __slots__ = ('tile_ids', 'seen', 'visible', 'count', 'version')
+
+    def __init__(self):
+        self.tile_ids = array('H', bytes(2 * CHUNK_AREA))
+        self.seen = array('L', _NO_BITS)
+        self.visible = array('L', _NO_BITS)
+        # number of cells with a tile
+        self.count = 0
+        self.version = 0
+
+
+class Room:
+    def __init__(self):
+        self.names_version = 0
+        self.clear()
+
+    def clear(self):
+        # (chunk_x, chunk_y) -> Chunk
+        self.chunks = {}
+
+        # interned tile names, the index is the tile id stored in the chunks
+        self.tile_names = [None]
+        self._tile_ids = {}
+        # bumped whenever a tile id gets a new name: on interning and on clear, after which
+        # the same ids may be interned for other names
+        self.names_version += 1
+
+        # chunks with any visible tile, so that clear_visible does not visit the whole room
+        self._visible_chunks = set()
+
+    def __len__(self):
+        return sum(chunk.count for chunk in self.chunks.values())
+
+    def tile_id(self, name):
+        tile_id = self._tile_ids.get(name)
+        if tile_id is None:
+            tile_id = len(self.tile_names)
+            self.tile_names.append(name)
+            self._tile_ids[name] = tile_id
+            self.names_version += 1
+        return tile_id
+
+    def _chunk(self, x, y):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = Chunk()
+        return chunk
+
+    def _set_tile(self, x, y, name, seen, is_visible):
+        chunk = self._chunk(x, y)
+        idx = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        if chunk.tile_ids[idx] == NO_TILE:
+            chunk.count += 1
+        chunk.tile_ids[idx] = self.tile_id(name)
+        self._set_bits(chunk, y & CHUNK_MASK, 1 << (x & CHUNK_MASK), seen, is_visible)
+
+    def _set_bits(self, chunk, row, bits, seen, is_visible):
+        """
+        set or clear the bits of a row of a chunk, visible bits are also set in seen
+
+        :param chunk:
+        :param row: row in the chunk
+        :param bits: mask of the columns to write
+        :param seen:
+        :param is_visible:
+        :return:
+        """
+        if is_visible:
+            chunk.visible[row] |= bits
+            chunk.seen[row] |= bits
+            self._visible_chunks.add(chunk)
+        else:
+            chunk.visible[row] &= ~bits & ROW_BITS
+            if seen:
+                chunk.seen[row] |= bits
+            else:
+                chunk.seen[row] &= ~bits & ROW_BITS
+        chunk.version += 1
+
+    def get_tile(self, x, y):
+        """
+        Tile at a position, built from the chunk arrays
+
+        :param x:
+        :param y:
+        :return: a Tile or None if there is no tile
+        """
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            return None
+        row = y & CHUNK_MASK
+        col = x & CHUNK_MASK
+        tile_id = chunk.tile_ids[(row << CHUNK_SHIFT) | col]
+        if tile_id == NO_TILE:
+            return None
+        seen = chunk.seen[row] >> col & 1
+        is_visible = chunk.visible[row] >> col & 1
+        return Tile(self.tile_names[tile_id], bool(seen), bool(is_visible))
+
+    def update_room(self, update_data):
+        """
+        apply a map payload from the server
+
+        :param update_data: either the legacy list of ((x, y), name, (seen, is_visible)),
+            or a dict with any of these compact encodings, applied in this order:
+
+            - 'tiles': legacy list as above
+            - 'rects': [x, y, width, height, name, seen, is_visible], one tile type for a rectangle
+            - 'runs': [x, y, [[name, count, seen, is_visible], ...]], consecutive runs along a row
+            - 'fov': [x, y, width, height, mask], the whole field of view: every tile outside of
+              it stops being visible, then the mask is applied like 'visibility'
+            - 'visibility': [x, y, width, height, mask], mask holds one is_visible bit per cell,
+              row major, least significant bit first, as bytes or a base64 string. Tile types
+              are not touched
+
+            visible tiles are always marked as seen
+        :return:
+        """
+        if not isinstance(update_data, dict):
+            logger.debug('map update: %d tiles', len(update_data))
+            self._update_tiles(update_data)
+            return
+
+        logger.debug('map update: %s', ', '.join(update_data))
+
+        self._update_tiles(update_data.get('tiles', ()))
+        for x, y, width, height, name, seen, is_visible in update_data.get('rects', ()):
+            tile_id = self.tile_id(name)
+            for row in range(y, y + height):
+                self._fill(x, row, width, tile_id, seen, is_visible)
+        for x, y, runs in update_data.get('runs', ()):
+            for name, count, seen, is_visible in runs:
+                self._fill(x, y, count, self.tile_id(name), seen, is_visible)
+                x += count
+        fov = update_data.get('fov')
+        if fov is not None:
+            self.clear_visible()
+            self._apply_visibility(*fov)
+        for x, y, width, height, mask in update_data.get('visibility', ()):
+            self._apply_visibility(x, y, width, height, mask)
+
+    def _update_tiles(self, tiles):
+        # _set_tile and _set_bits inlined, this runs for every tile of every map packet
+        chunks = self.chunks
+        tile_ids = self._tile_ids
+        visible_chunks = self._visible_chunks
+        for tile in tiles:
+            (x, y), name, (seen, is_visible) = tile
+
+            key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+            chunk = chunks.get(key)
+            if chunk is None:
+                chunk = chunks[key] = Chunk()
+            tile_id = tile_ids.get(name)
+            if tile_id is None:
+                tile_id = self.tile_id(name)
+
+            row = y & CHUNK_MASK
+            col = x & CHUNK_MASK
+            idx = (row << CHUNK_SHIFT) | col
+            if chunk.tile_ids[idx] == NO_TILE:
+                chunk.count += 1
+            chunk.tile_ids[idx] = tile_id
+            bit = 1 << col
+            if is_visible:
+                chunk.visible[row] |= bit
+                chunk.seen[row] |= bit
+                visible_chunks.add(chunk)
+            else:
+                chunk.visible[row] &= ~bit & ROW_BITS
+                if seen:
+                    chunk.seen[row] |= bit
+                else:
+                    chunk.seen[row] &= ~bit & ROW_BITS
+            chunk.version += 1
+
+    def _row_spans(self, x, y, length):
+        """
+        split a horizontal span into the parts lying in one chunk each
+
+        :return: iterator of (chunk, row in the chunk, first column in the chunk, length,
+            offset in the span)
+        """
+        row = y & CHUNK_MASK
+        offset = 0
+        while offset < length:
+            col = (x + offset) & CHUNK_MASK
+            n = min(CHUNK_SIZE - col, length - offset)
+            chunk = self._chunk(x + offset, y)
+            yield chunk, row, col, n, offset
+            offset += n
+
+    def _fill(self, x, y, length, tile_id, seen, is_visible):
+        """
+        set length tiles starting at x, y to one tile type, slice by slice
+
+        :return:
+        """
+        for chunk, row, col, n, _ in self._row_spans(x, y, length):
+            start = (row << CHUNK_SHIFT) | col
+            end = start + n
+            chunk.count += chunk.tile_ids[start:end].count(NO_TILE)
+            chunk.tile_ids[start:end] = array('H', (tile_id,)) * n
+            self._set_bits(chunk, row, ((1 << n) - 1) << col, seen, is_visible)
+
+    def _apply_visibility(self, x, y, width, height, mask):
+        """
+        write a visibility mask row by row, every row of a chunk is one masked assignment
+
+        :return:
+        """
+        if isinstance(mask, str):
+            mask = base64.b64decode(mask)
+        visible_chunks = self._visible_chunks
+        bit = 0
+        for map_y in range(y, y + height):
+            # the bits of this row, read from the few bytes it covers
+            row_bits = int.from_bytes(mask[bit >> 3:(bit + width + 7) >> 3], 'little') >> (bit & 7)
+            for chunk, row, col, n, offset in self._row_spans(x, map_y, width):
+                span = (1 << n) - 1
+                visible = (row_bits >> offset & span) << col
+                chunk.visible[row] = chunk.visible[row] & ~(span << col) | visible
+                if visible:
+                    chunk.seen[row] |= visible
+                    visible_chunks.add(chunk)
+                chunk.version += 1
+            bit += width
+
+    def clear_visible(self):
+        """
+        mark every tile as not visible, they stay seen
+
+        :return:
+        """
+        for chunk in self._visible_chunks:
+            chunk.visible = array('L', _NO_BITS)
+            chunk.version += 1
+        self._visible_chunks.clear()
+
+    def explored_chunks(self):
+        """
+        copies of the tile types and seen bits of every chunk with a seen tile
+
+        :return: dict (chunk_x, chunk_y) -> (tile_ids, seen), see restore_chunks
+        """
+        return {
+            key: (array('H', chunk.tile_ids), array('L', chunk.seen))
+            for key, chunk in self.chunks.items() if any(chunk.seen)
+        }
+
+    def restore_chunks(self, tile_names, chunks):
+        """
+        add chunks taken with explored_chunks, possibly from another Room
+
+        chunks the room already has are left as they are, no restored tile is visible
+
+        :param tile_names: tile_names of the room the chunks were taken from
+        :param chunks: dict (chunk_x, chunk_y) -> (tile_ids, seen)
+        :return: number of chunks added
+        """
+        ids = [NO_TILE if name is None else self.tile_id(name) for name in tile_names]
+        same_ids = ids == list(range(len(ids)))
+        added = 0
+        for key, (tile_ids, seen) in chunks.items():
+            if len(tile_ids) != CHUNK_AREA or len(seen) != CHUNK_SIZE:
+                raise ValueError('chunk %s has the wrong size' % (key,))
+            if max(tile_ids) >= len(ids) or max(seen) > ROW_BITS:
+                raise ValueError('chunk %s has invalid tiles' % (key,))
+            if key in self.chunks:
+                continue
+            chunk = Chunk()
+            chunk.tile_ids = array('H', tile_ids if same_ids else [ids[tile_id] for tile_id in tile_ids])
+            chunk.seen = array('L', seen)
+            chunk.count = CHUNK_AREA - chunk.tile_ids.count(NO_TILE)
+            self.chunks[tuple(key)] = chunk
+            added += 1
+        return added
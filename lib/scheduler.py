@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FPS = 20
+
+# renders skipped in a row at most, before a frame is drawn even if we are behind
+MAX_FRAME_SKIP = 5
+
+# seconds an idle loop sleeps at most when nothing is animated
+MAX_IDLE = 1.0
+
+
+class FrameScheduler:
+    """
+    paces the render loop
+
+    measures the real time between frames, tells the loop when to skip drawing because it
+    fell behind, and lets the loop sleep until the next animation deadline or an event
+    (input, network packet) when nothing needs to be drawn before that
+    """
+
+    def __init__(self, fps=DEFAULT_FPS, max_frame_skip=MAX_FRAME_SKIP):
+        self.fps = fps
+        self.max_frame_skip = max_frame_skip
+
+        self.last_frame = None
+        self.next_frame = None
+
+        # renders skipped in a row / in total
+        self.skipped = 0
+        self.frames_skipped = 0
+
+        # False if input can not wake us up, then we never sleep longer than a frame
+        self.watch_input = False
+
+        self._wakeup = asyncio.Event()
+
+    @property
+    def frame_time(self):
+        return 1 / self.fps
+
+    def wake(self):
+        """
+        something happened that should be drawn as soon as possible
+
+        :return:
+        """
+        self._wakeup.set()
+
+    def begin_frame(self):
+        """
+        start a frame
+
+        :return: seconds since the last frame started
+        """
+        now = time.monotonic()
+        if self.last_frame is None:
+            self.last_frame = now
+            self.next_frame = now
+        dt = now - self.last_frame
+        self.last_frame = now
+
+        self.next_frame += self.frame_time
+        if self.next_frame < now - self.max_frame_skip * self.frame_time:
+            # far behind or back from idling, schedule from now on
+            self.next_frame = now + self.frame_time
+        return dt
+
+    def should_render(self):
+        """
+        False if the frame should only be simulated, because the next one is already due
+
+        :return:
+        """
+        if time.monotonic() > self.next_frame and self.skipped < self.max_frame_skip:
+            self.skipped += 1
+            self.frames_skipped += 1
+            return False
+        self.skipped = 0
+        return True
+
+    async def wait(self, idle_timeout=None):
+        """
+        sleep until the next frame is due
+
+        :param idle_timeout: seconds until something needs to be drawn anyway (e.g. the next
+            animation frame), None if that is unknown. If that is later than the next frame,
+            sleep until then or until wake() is called
+        :return:
+        """
+        delay = max(self.next_frame - time.monotonic(), 0)
+        if self.watch_input and idle_timeout is not None and idle_timeout > delay \
+                and not self._wakeup.is_set():
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), idle_timeout)
+            except asyncio.TimeoutError:
+                pass
+            # idling is not falling behind, the frame after it is due now and is not skipped
+            now = time.monotonic()
+            self.next_frame = max(self.next_frame, now)
+            # never draw faster than the frame rate, even when events keep coming in
+            delay = self.next_frame - now
+        await asyncio.sleep(delay)
+        self._wakeup.clear()
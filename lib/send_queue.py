@@ -0,0 +1,63 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+MOVEMENT_ACTIONS = frozenset(('up', 'down', 'left', 'right'))
+
+# how repeated movement actions in one batch are merged
+# none: send everything, dedupe: drop a movement that repeats the previous action,
+# last: only send the last movement of the batch
+COALESCE_POLICIES = ('none', 'dedupe', 'last')
+
+
+def coalesce_actions(actions, policy):
+    """
+    merge the movement actions of one batch, other actions are always kept in order
+
+    :param actions: list of actions
+    :param policy: one of COALESCE_POLICIES
+    :return: list of actions
+    """
+    if policy == 'dedupe':
+        result = []
+        for action in actions:
+            if action in MOVEMENT_ACTIONS and result and result[-1] == action:
+                continue
+            result.append(action)
+        return result
+
+    if policy == 'last':
+        last_move = None
+        for idx, action in enumerate(actions):
+            if action in MOVEMENT_ACTIONS:
+                last_move = idx
+        return [action for idx, action in enumerate(actions)
+                if action not in MOVEMENT_ACTIONS or idx == last_move]
+
+    return actions
+
+
+class SendQueue:
+    def __init__(self, batch_window=0, coalesce='none'):
+        self.queue = asyncio.Queue()
+
+        # seconds to wait for more actions after the first one arrived
+        self.batch_window = batch_window
+        self.coalesce = coalesce
+
+    def add_action(self, action):
+        self.queue.put_nowait(action)
+
+    async def get_all_actions(self):
+        """
+        wait until an action arrives, then take everything queued within the batch window
+
+        :return: list of actions, merged according to the coalesce policy
+        """
+        actions = [await self.queue.get()]
+        if self.batch_window:
+            await asyncio.sleep(self.batch_window)
+        while not self.queue.empty():
+            actions.append(self.queue.get_nowait())
+        return coalesce_actions(actions, self.coalesce)
@@ -0,0 +1,99 @@
+"""
+spatial hash of entities by their server position
+
+entities are kept in buckets of 2 ** BUCKET_SHIFT cells squared, moving one touches at
+most two buckets, so keeping the hash up to date costs O(moves) per update packet and a
+query only visits the buckets overlapping its rect
+"""
+import math
+
+BUCKET_SHIFT = 4
+
+
+class SpatialHash:
+    def __init__(self, shift=BUCKET_SHIFT):
+        self.shift = shift
+        # (bucket x, bucket y) -> {entity: None}, dicts keep the insertion order
+        self.buckets = {}
+        # entity -> (bucket key, x, y)
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, entity):
+        return entity in self.entries
+
+    def move(self, entity, x, y):
+        """
+        add an entity or update its position
+
+        :param entity:
+        :param x:
+        :param y:
+        :return:
+        """
+        key = (x >> self.shift, y >> self.shift)
+        entry = self.entries.get(entity)
+        if entry is not None and entry[0] != key:
+            self._unlink(entity, entry[0])
+        if entry is None or entry[0] != key:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = {}
+            bucket[entity] = None
+        self.entries[entity] = (key, x, y)
+
+    def remove(self, entity):
+        entry = self.entries.pop(entity, None)
+        if entry is not None:
+            self._unlink(entity, entry[0])
+
+    def _unlink(self, entity, key):
+        bucket = self.buckets[key]
+        del bucket[entity]
+        if not bucket:
+            del self.buckets[key]
+
+    def clear(self):
+        self.buckets.clear()
+        self.entries.clear()
+
+    def query(self, x0, y0, x1, y1):
+        """
+        entities with their indexed position inside the rect
+
+        the order is stable as long as the entities stay in their buckets
+
+        :return: list of entities, x1 and y1 are exclusive
+        """
+        if math.isinf(x0) or math.isinf(y0) or math.isinf(x1) or math.isinf(y1):
+            return [entity for entity in self.entries if self._inside(entity, x0, y0, x1, y1)]
+
+        shift = self.shift
+        size = 1 << shift
+        bx0, by0 = int(x0) >> shift, int(y0) >> shift
+        bx1, by1 = (math.ceil(x1) - 1) >> shift, (math.ceil(y1) - 1) >> shift
+        if (bx1 - bx0 + 1) * (by1 - by0 + 1) > len(self.buckets):
+            keys = sorted((key for key in self.buckets if bx0 <= key[0] <= bx1 and by0 <= key[1] <= by1),
+                          key=lambda key: (key[1], key[0]))
+        else:
+            keys = [(bx, by) for by in range(by0, by1 + 1) for bx in range(bx0, bx1 + 1)]
+
+        found = []
+        buckets = self.buckets
+        for key in keys:
+            bucket = buckets.get(key)
+            if bucket is None:
+                continue
+            bx, by = key
+            if x0 <= bx * size and (bx + 1) * size <= x1 and y0 <= by * size and (by + 1) * size <= y1:
+                # the whole bucket is inside
+                found.extend(bucket)
+            else:
+                found.extend(entity for entity in bucket if self._inside(entity, x0, y0, x1, y1))
+        return found
+
+    def _inside(self, entity, x0, y0, x1, y1):
+        key, x, y = self.entries[entity]
+        return x0 <= x < x1 and y0 <= y < y1
@@ -0,0 +1,30 @@
+from collections import deque
+
+# samples kept per series, older ones are dropped
+SAMPLE_SIZE = 5000
+
+
+class Samples:
+    """
+    the last SAMPLE_SIZE values of a measurement, for percentiles
+    """
+
+    def __init__(self, size=SAMPLE_SIZE):
+        self.values = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value):
+        self.values.append(value)
+
+    def percentiles(self, *ps):
+        """
+        :param ps: percentiles, 0 - 100
+        :return: list of values, None for each if there are no samples
+        """
+        if not self.values:
+            return [None for _ in ps]
+        values = sorted(self.values)
+        last = len(values) - 1
+        return [values[min(last, int(round(p / 100 * last)))] for p in ps]
@@ -0,0 +1,124 @@
+"""
+recorded sessions: every received websocket message with the time it arrived
+
+a trace is a gzip stream of a magic, a length prefixed json header and then one record per
+message: seconds since the start of the recording (double), message type (byte), payload
+length (uint32) and the payload as received. It is written while playing, so a trace cut
+off by a crash is readable up to the last flush
+"""
+import gzip
+import json
+import logging
+import struct
+import threading
+import time
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+TRACE_MAGIC = b'ASCIITRACE'
+TRACE_VERSION = 1
+
+_RECORD = struct.Struct('<dBI')
+_LENGTH = struct.Struct('<I')
+
+_TEXT = 0
+_BINARY = 1
+
+# seconds between flushes of the compressed stream
+FLUSH_INTERVAL = 1.0
+
+
+class TraceWriter:
+    def __init__(self, path, **header):
+        """
+        :param path:
+        :param header: stored in the trace, e.g. the server url
+        """
+        self.path = path
+        self.file = gzip.open(path, 'wb', compresslevel=6)
+        self.start = time.monotonic()
+        self.last_flush = self.start
+        self.messages = 0
+        # written from the network thread in threaded mode, closed from the main thread
+        self.lock = threading.Lock()
+
+        header = dict(header, version=TRACE_VERSION, started=time.time())
+        header_data = json.dumps(header).encode()
+        self.file.write(TRACE_MAGIC + _LENGTH.pack(len(header_data)) + header_data)
+
+    def write(self, msg, received=None):
+        """
+        record a text or binary websocket message, other message types are ignored
+
+        :param msg: aiohttp WSMessage
+        :param received: time.monotonic() the message arrived at
+        :return:
+        """
+        if msg.type == aiohttp.WSMsgType.TEXT:
+            kind, data = _TEXT, msg.data.encode()
+        elif msg.type == aiohttp.WSMsgType.BINARY:
+            kind, data = _BINARY, msg.data
+        else:
+            return
+        if received is None:
+            received = time.monotonic()
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(_RECORD.pack(received - self.start, kind, len(data)))
+            self.file.write(data)
+            self.messages += 1
+
+            if received - self.last_flush >= FLUSH_INTERVAL:
+                self.file.flush()
+                self.last_flush = received
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.close()
+        logger.info('recorded %d messages to %s', self.messages, self.path)
+
+
+class TraceReader:
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, 'rb')
+        magic = self.file.read(len(TRACE_MAGIC))
+        if magic != TRACE_MAGIC:
+            self.file.close()
+            raise ValueError('%s is not a trace file' % path)
+        length, = _LENGTH.unpack(self.file.read(_LENGTH.size))
+        self.header = json.loads(self.file.read(length))
+        if self.header.get('version') != TRACE_VERSION:
+            self.file.close()
+            raise ValueError('%s: unsupported trace version %s' % (path, self.header.get('version')))
+
+    def __iter__(self):
+        """
+        :return: iterator of (seconds since the start of the recording, aiohttp WSMessage)
+        """
+        read = self.file.read
+        try:
+            while True:
+                record = read(_RECORD.size)
+                if not record:
+                    return
+                if len(record) < _RECORD.size:
+                    break
+                offset, kind, length = _RECORD.unpack(record)
+                data = read(length)
+                if len(data) < length:
+                    break
+                if kind == _TEXT:
+                    yield offset, aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, data.decode(), None)
+                else:
+                    yield offset, aiohttp.WSMessage(aiohttp.WSMsgType.BINARY, data, None)
+        except EOFError:
+            pass
+        finally:
+            self.file.close()
+        logger.warning('%s ends with an incomplete record', self.path)
@@ -1,26 +1,44 @@
 import asyncio
-import json
+import glob
 import time
 import logging
-import uuid
+import sys
+from collections import deque
+from operator import attrgetter
 from time import sleep
 
 import aiohttp
 import click
 
-from lib.creatures.creature import Creature
-from lib.creatures.player import Player
-from lib.init_logging import init_logging
+from lib.codec import CODECS, JsonCodec, get_codec
+from lib.creatures._sprite import sprite_library
+from lib.creatures.animation import animator
+from lib.creatures.creature import Creature, CREATURE_SPRITES
+from lib.creatures.motion import Prediction, TELEPORT_DISTANCE
+from lib.creatures.player import Player, PLAYER_SPRITE
+from lib.creatures.pool import EntityPool
+from lib.init_logging import init_logging, LOG_FILE, LOG_LEVELS
+from lib.map_cache import MAP_CACHE_DIR, MapCache, save_map_cache
+from lib.render import FrameComposer, MapLayer
+from lib.mailbox import PendingState
+from lib.metrics import Metrics, write_metrics
+from lib.network_thread import new_event_loop, NetworkThread
+from lib.reconnect import Backoff, connect_with_backoff, resume_url
+from lib.room import Room
+from lib.scheduler import DEFAULT_FPS, MAX_IDLE, FrameScheduler
+from lib.send_queue import COALESCE_POLICIES, SendQueue
+from lib.spatial import SpatialHash
+from lib.trace import TraceReader, TraceWriter
 from asciimatics.event import KeyboardEvent
 from asciimatics.screen import ManagedScreen
 
-init_logging('debug')
 logger = logging.getLogger(__name__)
 
 # keys needed for local stuff
 KEYS = dict(
     # action: key code
-    quit=ord('q')
+    quit=ord('q'),
+    metrics=ord('p'),
 )
 
 # actions sent to server
@@ -33,184 +51,458 @@ KEY_ACTIONS = {
 }
 
 
-class Tile:
-    def __init__(self, name, seen, is_visible):
-        self.name = name
-        self.seen = seen
-        self.is_visible = is_visible
+# map glyph of each tile type, a tile covers a single screen cell
+TILE_GLYPHS = {
+    'wall': '#',
+    'floor': '.',
+}
 
 
-TILE_LAYOUT = {
-    'wall': [
-        ['#', '#', '#'],
-        ['#', ' ', '#'],
-        ['#', '#', '#']
-    ],
-    'floor': [
-        ['.', '.', '.'],
-        ['.', '.', '.'],
-        ['.', '.', '.'],
-    ]
-}
+send_queue = SendQueue()
+frame_scheduler = FrameScheduler()
+current_room = Room()
+player = Player()
 
+other_players = {}
+creatures = {}
 
-class Room:
-    def __init__(self):
-        self.tiles = {}
+# timings and counters for the overlay, --metrics-file and --stats
+metrics = Metrics()
 
-    def _set_tile(self, x, y, name, seen, is_visible):
-        if not self.tiles.get(y, False):
-            self.tiles[y] = {}
+# own movement shown before the server confirms it
+prediction = Prediction()
 
-        self.tiles[y][x] = Tile(name, seen, is_visible)
+# removed players and creatures are recycled for the next spawn
+player_pool = EntityPool(lambda key: Player())
+creature_pool = EntityPool(Creature)
 
-    def update_room(self, update_data):
-        for tile in update_data:
-            logger.info(tile)
-            (x, y), name, (seen, is_visible) = tile
-            self._set_tile(x, y, name, seen, is_visible)
+# other players and creatures by server position, for culling and draw order
+entity_index = SpatialHash()
 
 
-class SendQueue:
-    def __init__(self):
-        self.queue = asyncio.Queue()
+# action batches being written to the socket at the same time
+MAX_IN_FLIGHT = 2
 
-    def add_action(self, action):
-        self.queue.put_nowait(action)
 
-    async def get_all_actions(self):
-        actions = []
-        for _ in range(self.queue.qsize()):
-            actions.append(await self.queue.get())
-        return actions
+class Client:
+    def __init__(self, encodings=(JsonCodec.name,), max_in_flight=MAX_IN_FLIGHT, latency=0,
+                 threaded=False, use_uvloop=False, reconnect=True):
+        # threaded: the websocket lives in a NetworkThread, which also decodes the packets
+        self.threaded = threaded
+        self.use_uvloop = use_uvloop
+        self.network = None
+
+        self.url = None
+        self.session = None
+        self.ws = None
 
+        # connect again when the websocket drops, the room and entities are kept meanwhile
+        self.reconnect = reconnect
+        # tick of the last received packet, the server is asked to resume from there
+        self.last_tick = None
 
-send_queue = SendQueue()
-current_room = Room()
-player = Player()
+        # MapCache of the server, see --map-cache
+        self.map_cache = None
 
-other_players = {}
-creatures = {}
+        # (time received, packet) decoded but not applied yet, filled from the network thread
+        # in threaded mode, so only append / popleft are used
+        self.inbox = deque()
 
+        # receive times of packets applied since the last drawn frame
+        self.applied = []
 
-class Client:
-    def __init__(self):
-        self.session = aiohttp.ClientSession()
-        self.package_queue = asyncio.Queue()
-        self.ws = None
+        # updates of one frame, merged before they are applied
+        self.pending = PendingState()
+
+        # while this many batches are still being sent, new actions wait in the send queue
+        # and are merged into the next batch
+        self.max_in_flight = max_in_flight
+
+        # seconds added to every packet in both directions, to try out a slow connection
+        self.latency = latency
+
+        # TraceWriter that gets every received message, see --record
+        self.recorder = None
+
+        # encodings we accept, in order of preference
+        self.encodings = list(encodings)
+        self.text_codec = get_codec(JsonCodec.name)
+        self.binary_codec = None
+
+        # packet type -> handler(packet data)
+        self.packet_handlers = {
+            'init': self.on_init,
+            'update': self.on_update,
+            'remove_players': self.on_remove_players,
+            'remove_creatures': self.on_remove_creatures,
+        }
 
     async def init(self, url):
-        self.ws = await self.session.ws_connect(url)
+        self.url = url
+        if self.threaded:
+            loop = asyncio.get_event_loop()
+            self.network = NetworkThread(self.connect_url, self.receive, loop, self.notify,
+                                         handshake=self.handshake, reconnect=self.reconnect,
+                                         use_uvloop=self.use_uvloop)
+            self.network.start()
+            await asyncio.wrap_future(self.network.connected)
+        else:
+            # created here so that the session belongs to the running loop
+            self.session = aiohttp.ClientSession()
+            await self.connect()
+            asyncio.ensure_future(self.receive_loop())
         asyncio.ensure_future(self.send_loop())
-        asyncio.ensure_future(self.receive_loop())
+
+    def connect_url(self):
+        """
+        :return: the server url, asking to resume from the last tick after a reconnect
+        """
+        return resume_url(self.url, self.last_tick)
+
+    async def connect(self):
+        url = self.connect_url()
+        self.ws = await self.session.ws_connect(url)
+        logger.info('connected to %s', url)
+        for data in self.handshake():
+            await self.ws.send_str(data)
+
+    @property
+    def is_connected(self):
+        if self.network:
+            return self.network.is_connected
+        return self.ws is not None and not self.ws.closed
+
+    async def send_str(self, data):
+        if self.network:
+            await asyncio.wrap_future(self.network.send_str(data))
+        else:
+            await self.ws.send_str(data)
+
+    def handshake(self):
+        """
+        text messages sent first on every connection: the offer of binary encodings
+
+        servers that do not know the offer keep sending json text frames, which always work.
+        Called from the network thread in threaded mode
+
+        :return: list of encoded messages
+        """
+        binary = [name for name in self.encodings if get_codec(name).binary]
+        if not binary:
+            return []
+        self.binary_codec = get_codec(binary[0])
+        return [self.text_codec.encode({'type': 'encodings', 'data': self.encodings})]
 
     async def send_loop(self):
+        in_flight = asyncio.Semaphore(self.max_in_flight)
         while True:
+            await in_flight.acquire()
             actions = await send_queue.get_all_actions()
+            asyncio.ensure_future(self.send_actions(actions, in_flight))
+
+    async def send_actions(self, actions, in_flight):
+        try:
             if actions:
-                logger.info(actions)
-                logger.info('sending actions: %s' % actions)
-                await self.ws.send_str(json.dumps({'type': 'actions', 'data': actions}))
-            await asyncio.sleep(1 / 20)
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if not self.is_connected:
+                    # stale by the time we are back
+                    logger.info('not connected, dropped actions: %s', actions)
+                    return
+                logger.debug('sending actions: %s', actions)
+                await self.send_str(self.text_codec.encode({'type': 'actions', 'data': actions}))
+        except (aiohttp.ClientError, ConnectionError) as e:
+            logger.info('sending actions failed: %s', e)
+        finally:
+            in_flight.release()
 
     async def receive_loop(self):
-        async for msg in self.ws:
-            # await ws.send_str('tick!')
-
-            if msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
-                logger.warning('error message: %s' % msg.data)
-                pass
-
-            elif msg.type == aiohttp.WSMsgType.text:
-                # logger.debug('got msg: %s' % msg.data)
-                packet = json.loads(msg.data)
-                if packet['type'] == 'init':
-                    logger.debug("Got init package")
-
-                    current_room.update_room(packet['data']['map'])
-
-                    player.update(packet['data']['self'])
-
-                    other_players_data = packet['data'].get('players', False)
-                    if other_players_data:
-                        for uid, player_data in other_players_data.items():
-                            other_player = other_players.get(uid, False)
-                            if not other_player:
-                                other_players[uid] = Player()
-                            other_players[uid].update(player_data)
-
-                    creatures_data = packet['data'].get('creatures', False)
-                    if creatures_data:
-                        for uid, creature_data in creatures_data.items():
-                            creature = creatures.get(uid, False)
-                            if not creature:
-                                creatures[uid] = Creature(creature_data['type'])
-                            creatures[uid].update(creature_data)
-
-                elif packet['type'] == 'update':
-                    map = packet['data'].get('map', False)
-                    if map:
-                        current_room.update_room(map)
-                    player_data = packet['data'].get('self', False)
-                    if player_data:
-                        player.update(player_data)
-
-                    other_players_data = packet['data'].get('players', False)
-                    if other_players_data:
-                        for uid, player_data in other_players_data.items():
-                            other_player = other_players.get(uid, False)
-                            if not other_player:
-                                other_players[uid] = Player()
-                            other_players[uid].update(player_data)
-
-                    creatures_data = packet['data'].get('creatures', False)
-                    if creatures_data:
-                        for uid, creature_data in creatures_data.items():
-                            creature = creatures.get(uid, False)
-                            if not creature:
-                                creatures[uid] = Creature(creature_data['type'])
-                            creatures[uid].update(creature_data)
-
-                elif packet['type'] == 'remove_players':
-                    uids = packet['data']
-                    for uid in uids:
-                        logger.info('player %s left' % uid)
-                        del other_players[uid]
-                elif packet['type'] == 'remove_creatures':
-                    uids = packet['data']
-                    for uid in uids:
-                        del creatures[uid]
-                else:
-                    logger.debug("Got undefined message %s" % msg.data)
-
-                # await ws.send_str("Pressed key code: {}".format(msg.data))
+        backoff = Backoff()
+        while True:
+            try:
+                async for msg in self.ws:
+                    # await ws.send_str('tick!')
+                    if self.receive(msg):
+                        backoff.reset()
+                        self.notify()
+            except (aiohttp.ClientError, ConnectionError) as e:
+                logger.warning('connection lost: %s', e)
+            if not self.reconnect:
+                logger.warning('disconnected')
+                return
+            await connect_with_backoff(self.connect, backoff)
+
+    def receive(self, msg):
+        """
+        decode a websocket message into the inbox, runs in the network thread in threaded mode
+
+        :param msg:
+        :return: True if a packet was added
+        """
+        received = time.monotonic()
+        if msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+            logger.warning('error message: %s', msg.data)
+            return False
+
+        if msg.type == aiohttp.WSMsgType.TEXT:
+            # logger.debug('got msg: %s' % msg.data)
+            codec = self.text_codec
+        elif msg.type == aiohttp.WSMsgType.BINARY and self.binary_codec:
+            codec = self.binary_codec
+        else:
+            logger.info('got message of type %s', msg.type)
+            return False
+
+        if self.recorder:
+            self.recorder.write(msg, received)
+        # the trace keeps the arrival time, writing it is not part of decoding
+        decode_start = time.monotonic()
+        packet = codec.decode(msg.data)
+        if packet['type'] == 'encoding':
+            # the next frame may already use it, this can not wait for poll
+            self.on_encoding(packet['data'])
+            return False
+        tick = packet.get('tick')
+        if tick is not None:
+            self.last_tick = tick
+        metrics.decode_times.add(time.monotonic() - decode_start)
+        self.inbox.append((received, packet))
+        return True
+
+    def notify(self):
+        if self.latency:
+            asyncio.get_event_loop().call_later(self.latency, frame_scheduler.wake)
+        else:
+            frame_scheduler.wake()
+
+    def poll(self):
+        """
+        apply the packets in the inbox, called at the start of each frame
+
+        update and remove packets are merged first and applied once, see PendingState.
+        with a simulated latency, packets stay in the inbox until they are old enough
+
+        :return:
+        """
+        inbox = self.inbox
+        pending = self.pending
+        release = time.monotonic() - self.latency
+        while inbox and inbox[0][0] <= release:
+            received, packet = inbox.popleft()
+            self.applied.append(received)
+            metrics.packets += 1
+            if not pending.merge(packet):
+                # keep the order with packets that can not be merged
+                self.apply_pending()
+                self.handle_packet(packet)
+        self.apply_pending()
+
+    def apply_pending(self):
+        if self.pending:
+            for packet in self.pending.drain():
+                self.handle_packet(packet)
+
+    def handle_packet(self, packet):
+        handler = self.packet_handlers.get(packet['type'])
+        if handler:
+            handler(packet['data'])
+        else:
+            logger.debug("Got undefined message %s", packet)
+
+    def on_encoding(self, data):
+        # the server confirmed which binary encoding it will use
+        self.binary_codec = get_codec(data)
+
+    def on_init(self, data):
+        logger.debug("Got init package")
+        if self.map_cache is not None:
+            self.map_cache.enter(current_room, data.get('room'), player)
+        # the full state, after a reconnect entities missing here are gone
+        players_data = data.get('players') or {}
+        creatures_data = data.get('creatures') or {}
+        self.on_remove_players([uid for uid in other_players if uid not in players_data])
+        self.on_remove_creatures([uid for uid in creatures if uid not in creatures_data])
+        self.apply_state(data)
+
+    def on_update(self, data):
+        self.apply_state(data)
+
+    def apply_state(self, data):
+        """
+        apply the map, self, players and creatures parts of an init or update packet
+
+        :param data:
+        :return:
+        """
+        map = data.get('map', False)
+        if map:
+            current_room.update_room(map)
+
+        player_data = data.get('self', False)
+        if player_data:
+            player.update(player_data)
+            if prediction.enabled:
+                prediction.reconcile(player, *player_data['coords'])
+            else:
+                player.x, player.y = player_data['coords']
+
+        other_players_data = data.get('players', False)
+        if other_players_data:
+            self.apply_entities(other_players, other_players_data, player_pool)
+
+        creatures_data = data.get('creatures', False)
+        if creatures_data:
+            self.apply_entities(creatures, creatures_data, creature_pool, type_key='type')
+
+    @staticmethod
+    def apply_entities(entities, entities_data, pool, type_key=None):
+        """
+        update entities by uid, new ones are taken from the pool
+
+        :param entities: uid -> entity
+        :param entities_data: uid -> update data
+        :param pool: EntityPool for new entities
+        :param type_key: key in the update data that selects the pool key, if any
+        :return:
+        """
+        for uid, entity_data in entities_data.items():
+            entity = entities.get(uid)
+            if entity is None:
+                key = entity_data[type_key] if type_key else None
+                entity = entities[uid] = pool.acquire(key)
+                entity.update(entity_data)
+                # animated once ScreenManager.tick finds it in view
+                animator.sleep(entity.sprite.slot)
             else:
-                logger.info('got message of type %s' % msg.type)
+                entity.update(entity_data)
+            motion = entity.motion
+            entity_index.move(entity, motion.to_x, motion.to_y)
+
+    def on_remove_players(self, uids):
+        for uid in uids:
+            logger.info('player %s left', uid)
+            other_player = other_players.pop(uid, None)
+            if other_player is not None:
+                entity_index.remove(other_player)
+                player_pool.release(other_player)
+
+    def on_remove_creatures(self, uids):
+        for uid in uids:
+            creature = creatures.pop(uid, None)
+            if creature is not None:
+                entity_index.remove(creature)
+                creature_pool.release(creature, creature.type)
+
+
+# tiles the own player can not be predicted to walk into
+BLOCKING_TILES = {'wall'}
+
+# entities up to this many tiles outside the window are still ticked and drawn, so that
+# sprites reaching into it are not culled. The map is only drawn for the window itself
+VIEW_MARGIN = 2
 
 
 class ScreenManager:
-    def __init__(self):
+    def __init__(self, view_margin=VIEW_MARGIN, client=None, show_metrics=False):
         self.send_queue = SendQueue()
+        # packets received by the client are applied at the start of each frame
+        self.client = client
         self.screen = None
+        self.frame = None
+        self.map_layer = MapLayer(current_room, TILE_GLYPHS)
+        self.camera_x = 0
+        self.camera_y = 0
+        self.view_margin = view_margin
+
+        # entities ticked in the last frame, the others sleep
+        self.awake = set()
+        # an entity in view was still interpolated in the last frame
+        self.moving = False
+
+        # performance overlay, toggled with KEYS['metrics']
+        self.show_metrics = show_metrics
+        self.metrics_snapshot = None
+        self.metrics_updated = 0
+        self.metrics_lines = []
+
+    def attach_screen(self, screen):
+        """
+        draw to a screen, an asciimatics screen or anything with the same print_at / refresh /
+        clear_buffer surface
+
+        :param screen:
+        :return:
+        """
+        self.screen = screen
+        self.frame = FrameComposer(screen)
+
+    def visible_rect(self):
+        """
+        map coordinates of the window around the player, including the margin
+
+        entities positioned outside of it are not drawn
+
+        :return: x0, y0, x1, y1 with x1, y1 exclusive
+        """
+        x0 = -self.camera_x - self.view_margin
+        y0 = -self.camera_y - self.view_margin
+        x1 = x0 + self.screen.width + 2 * self.view_margin
+        y1 = y0 + self.screen.height + 2 * self.view_margin
+        return x0, y0, x1, y1
+
+    @staticmethod
+    def entities_near(x0, y0, x1, y1):
+        """
+        other players and creatures that may be shown inside the rect
+
+        the shown position trails the server position by at most the teleport distance,
+        so this includes some entities just outside
+
+        :return: list of entities, x1 and y1 exclusive
+        """
+        return entity_index.query(x0 - TELEPORT_DISTANCE, y0 - TELEPORT_DISTANCE,
+                                  x1 + TELEPORT_DISTANCE, y1 + TELEPORT_DISTANCE)
 
-    def screen_print_with_player_offset(self, s, x, y, colour=7, attr=0, bg=0):
-        centre_x = (self.screen.width // 2) - player.x
-        centre_y = (self.screen.height // 2) - player.y
-        self.screen.print_at(s, centre_x + x, centre_y + y, colour=colour, attr=attr, bg=bg)
+    def update_camera(self):
+        """
+        screen position of map coordinate 0, 0 for this frame, player is center
+
+        :return:
+        """
+        self.camera_x = (self.screen.width // 2) - player.x
+        self.camera_y = (self.screen.height // 2) - player.y
 
-    def draw_tile(self, name, x, y, color):
-        sprite = TILE_LAYOUT.get(name, False)
-        if sprite:
-            for row_idx, row in enumerate(sprite):
-                for col_idx, char in enumerate(row):
-                    self.screen_print_with_player_offset(char, x, y, colour=color)
+    def draw_map(self):
+        """
+        blit the pre-rasterised map
+
+        :return:
+        """
+        self.map_layer.blit(self.frame, -self.camera_x, -self.camera_y)
 
     def draw_player(self, player: Player):
         self.draw_creature(player)
 
     def draw_hit_points(self):
         offset = (2, 2)
-        self.screen.print_at('%s / %s' % (player.hit_points, 100), offset[0], offset[1])
+        self.frame.put_string('%s / %s' % (player.hit_points, 100), offset[0], offset[1])
+
+    def draw_metrics(self):
+        """
+        performance overlay, the text is updated once per second
+
+        :return:
+        """
+        now = time.monotonic()
+        if now - self.metrics_updated >= 1:
+            snapshot = metrics.snapshot(self.metrics_snapshot)
+            self.metrics_lines = format_metrics(snapshot)
+            self.metrics_snapshot = snapshot
+            self.metrics_updated = now
+
+        offset = (2, 4)
+        for idx, line in enumerate(self.metrics_lines):
+            self.frame.put_string(line, offset[0], offset[1] + idx, colour=self.screen.COLOUR_GREEN)
 
     def draw_creature(self, creature: Creature):
         sprite = creature.sprite.get_cells()
@@ -220,99 +512,454 @@ class ScreenManager:
             color = creature.color
         if not creature.is_visible:
             color = 10
+        screen_x = self.camera_x + creature.x
+        screen_y = self.camera_y + creature.y
+        put = self.frame.put
         for row_idx, row in enumerate(sprite):
             for col_idx, char in enumerate(row):
                 if char:
-                    self.screen_print_with_player_offset(char, creature.x + col_idx, creature.y + row_idx,
-                                                         colour=color, attr=attr, bg=bg)
+                    put(char, screen_x + col_idx, screen_y + row_idx, colour=color, attr=attr, bg=bg)
 
     def handle_input(self):
+        # handle everything that arrived since the last frame, the loop may have been idle
         event = self.screen.get_event()
-        if event and type(event) == KeyboardEvent:
-            if event.key_code == KEYS['quit']:
-                return False
-            action = KEY_ACTIONS.get(event.key_code, False)
-            logger.info(action)
-            if action:
-                send_queue.add_action(action)
+        while event:
+            if type(event) == KeyboardEvent:
+                if event.key_code == KEYS['quit']:
+                    return False
+                if event.key_code == KEYS['metrics']:
+                    self.show_metrics = not self.show_metrics
+                action = KEY_ACTIONS.get(event.key_code, False)
+                logger.debug('action %s', action)
+                if action:
+                    send_queue.add_action(action)
+                    if prediction.enabled:
+                        prediction.predict(player, action, is_blocked=self.is_blocked)
+            event = self.screen.get_event()
         return True
 
+    @staticmethod
+    def is_blocked(x, y):
+        tile = current_room.get_tile(x, y)
+        return tile is not None and tile.name in BLOCKING_TILES
+
+    def watch_input(self):
+        """
+        wake the frame scheduler when there is terminal input
+
+        without this the loop keeps polling input at the frame rate
+
+        :return:
+        """
+        try:
+            asyncio.get_event_loop().add_reader(sys.stdin.fileno(), frame_scheduler.wake)
+        except (NotImplementedError, ValueError, OSError) as e:
+            logger.info('can not watch input, polling instead: %s' % e)
+            frame_scheduler.watch_input = False
+        else:
+            frame_scheduler.watch_input = True
+
     def tick(self, dt):
         """
-        update sprites
+        update sprites and move entities towards their server positions
+
+        entities out of view are skipped, their sprites sleep and catch up when they wake,
+        their position is computed from the time when they are ticked again
 
         :param dt: 
         :return: 
         """
-        player.tick_sprite_state(dt)
-        for uid, other_player in other_players.items():
-            other_player.tick_sprite_state(dt)
-        for uid, creature in creatures.items():
-            creature.tick_sprite_state(dt)
+        now = time.monotonic()
+        if self.screen is None:
+            in_view = list(other_players.values()) + list(creatures.values())
+        else:
+            self.update_camera()
+            in_view = self.entities_near(*self.visible_rect())
+
+        moving = False
+        for entity in in_view:
+            slot = entity.sprite.slot
+            if slot in animator.sleeping:
+                animator.wake(slot)
+            entity.tick_motion(now)
+            motion = entity.motion
+            if now - motion.start < motion.duration:
+                moving = True
+        self.moving = moving
+
+        # put the sprites of the entities that left the view to sleep
+        awake = set(in_view)
+        for entity in self.awake - awake:
+            animator.sleep(entity.sprite.slot)
+        self.awake = awake
+
+        ticked = len(in_view) + 1
+        skipped = len(other_players) + len(creatures) + 1 - ticked
+        metrics.ticked_entities = ticked
+        metrics.skipped_entities = skipped
+
+        # sprites of all entities in one pass, hidden and sleeping ones are inactive
+        animator.tick(dt)
+
+    def time_to_next_animation(self):
+        """
+        seconds until any animated sprite changes, or at most a frame while entities in
+        view are interpolated
+
+        :return:
+        """
+        remaining = animator.time_to_next_frame()
+        if self.moving:
+            # interpolated entities move on every frame
+            frame_time = frame_scheduler.frame_time
+            return frame_time if remaining is None else min(remaining, frame_time)
+        # nothing is animated, still wake up now and then, e.g. for the metrics overlay
+        return MAX_IDLE if remaining is None else remaining
+
+    def draw_frame(self):
+        # compose the frame offscreen, only changed cells reach the screen
+        self.frame.begin()
+        self.update_camera()
+
+        start = time.perf_counter()
+        self.draw_map()
+        map_done = time.perf_counter()
+
+        # top to bottom, so that lower entities overlap the ones above them
+        x0, y0, x1, y1 = self.visible_rect()
+        shown = [entity for entity in self.entities_near(x0, y0, x1, y1)
+                 if x0 <= entity.x < x1 and y0 <= entity.y < y1]
+        shown.append(player)
+        # stable sort, entities on the same cell keep the order of the index
+        shown.sort(key=attrgetter('y', 'x'))
+        for entity in shown:
+            self.draw_creature(entity)
+        entities_done = time.perf_counter()
+
+        self.draw_hit_points()
+        if self.show_metrics:
+            self.draw_metrics()
+
+        # draw the screen!
+        self.frame.flush()
+
+        metrics.add_section('map', map_done - start)
+        metrics.add_section('entities', entities_done - map_done)
+        metrics.add_section('flush', time.perf_counter() - entities_done)
+
+    def record_packet_latency(self):
+        """
+        time from receiving to drawing, for the packets applied since the last drawn frame
+
+        :return:
+        """
+        if self.client and self.client.applied:
+            now = time.monotonic()
+            for received in self.client.applied:
+                metrics.packet_latency.add(now - received)
+            self.client.applied.clear()
 
     async def run(self):
-        FPS = 1 / 20
         with ManagedScreen() as screen:
-            self.screen = screen
+            self.attach_screen(screen)
+            self.watch_input()
             while True:
-                _continue = True
+                dt = frame_scheduler.begin_frame()
 
-                self.handle_input()
+                if not self.handle_input():
+                    break
 
-                self.tick(FPS)
+                # simulation always advances by the real elapsed time, drawing may be skipped
+                self.step(dt, render=frame_scheduler.should_render())
 
-                # clear screen
-                self.screen.clear_buffer(self.screen.COLOUR_WHITE, self.screen.A_NORMAL, self.screen.COLOUR_BLACK)
-                self.draw_hit_points()
+                await frame_scheduler.wait(self.time_to_next_animation())
 
-                # render map, player is center
-                for y_coord, row in current_room.tiles.items():
-                    for x_coord, tile in row.items():
-                        name = ' '
-                        draw_colour = self.screen.COLOUR_WHITE
-                        if tile.is_visible:
-                            name = tile.name
-                            draw_colour = self.screen.COLOUR_WHITE
-                        elif tile.seen:
-                            name = tile.name
-                            draw_colour = self.screen.COLOUR_MAGENTA
-                        self.draw_tile(name, x_coord, y_coord, draw_colour)
+        asyncio.get_event_loop().stop()
 
-                self.draw_player(player)
-                for uid, other_player in other_players.items():
-                    self.draw_player(other_player)
+    def step(self, dt, render=True):
+        """
+        one frame: apply the received packets, advance the simulation by dt and draw
 
-                for uid, creature in creatures.items():
-                    self.draw_creature(creature)
+        :param dt: seconds since the last frame
+        :param render: False to only simulate this frame
+        :return:
+        """
+        frame_start = time.perf_counter()
+        if self.client:
+            self.client.poll()
+        poll_done = time.perf_counter()
+
+        self.tick(dt)
+        tick_done = time.perf_counter()
+
+        metrics.frames += 1
+        if render:
+            self.draw_frame()
+            self.record_packet_latency()
+            metrics.rendered_frames += 1
+
+        metrics.add_section('poll', poll_done - frame_start)
+        metrics.add_section('tick', tick_done - poll_done)
+        metrics.frame_times.add(time.perf_counter() - frame_start)
+
+
+async def feed_trace(client, trace, speed=1.0):
+    """
+    pass the messages of a recorded session to the client at the pace they were received
+
+    :param client:
+    :param trace: TraceReader
+    :param speed: factor the recorded time is sped up by
+    :return:
+    """
+    start = time.monotonic()
+    for offset, msg in trace:
+        delay = start + offset / speed - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if client.receive(msg):
+            client.notify()
+    logger.info('replay finished, %d packets', metrics.packets)
+
+
+def replay_headless(client, screen_manager, trace, fps):
+    """
+    replay a recorded session as fast as possible
+
+    messages are grouped into frames of the recorded time, each frame is polled, ticked
+    and drawn like in the terminal. A pause in the recording is a single long frame
+
+    :param client:
+    :param screen_manager: attached to a headless screen
+    :param trace: TraceReader
+    :param fps: frames per second of recorded time
+    :return: seconds it took
+    """
+    frame = 0
+    last_frame = -1
+    start = time.perf_counter()
+    for offset, msg in trace:
+        msg_frame = int(offset * fps)
+        if msg_frame > frame:
+            screen_manager.step((frame - last_frame) / fps)
+            last_frame = frame
+            frame = msg_frame
+        client.receive(msg)
+    screen_manager.step((frame - last_frame) / fps)
+    return time.perf_counter() - start
+
+
+def reset_game_state():
+    """
+    forget the room and all entities, e.g. before starting over with a new init packet
+
+    :return:
+    """
+    current_room.clear()
+    player.reset()
+    prediction.reset()
+    entity_index.clear()
+    while other_players:
+        uid, other_player = other_players.popitem()
+        player_pool.release(other_player)
+    while creatures:
+        uid, creature = creatures.popitem()
+        creature_pool.release(creature, creature.type)
+
+
+def count_entities():
+    return {
+        'players': len(other_players) + 1,
+        'creatures': len(creatures),
+        'tiles': len(current_room),
+        'chunks': len(current_room.chunks),
+    }
+
+
+metrics.counts = count_entities
+
+
+def format_metrics(snapshot):
+    """
+    overlay lines for a metrics snapshot
+
+    :param snapshot:
+    :return: list of strings
+    """
+    def ms(value):
+        return '-' if value is None else '%.1f' % value
+
+    frame_ms = snapshot['frame_ms'] or {}
+    latency_ms = snapshot['latency_ms'] or {}
+    decode_us = snapshot['decode_us_p50']
+    return [
+        'fps %.1f  ticks/s %.1f' % (snapshot.get('fps', 0), snapshot.get('ticks_per_s', 0)),
+        'frame ms p50 %s p99 %s' % (ms(frame_ms.get('p50')), ms(frame_ms.get('p99'))),
+        'ms ' + '  '.join('%s %s' % (name, ms(value)) for name, value in snapshot['section_ms_p50'].items()),
+        'packets/s %.1f  decode us %s  latency ms p50 %s p99 %s' % (
+            snapshot.get('packets_per_s', 0), '-' if decode_us is None else '%.0f' % decode_us,
+            ms(latency_ms.get('p50')), ms(latency_ms.get('p99'))),
+        'players %s  creatures %s  tiles %s  chunks %s' % (
+            snapshot['players'], snapshot['creatures'], snapshot['tiles'], snapshot['chunks']),
+        'ticked %s  skipped %s' % (snapshot['ticked_entities'], snapshot['skipped_entities']),
+    ]
 
-                '''
-                for creature in self.player.room.creatures:
-                    if creature.current_tile.is_visible:
-                        creature.draw(self, dt=fps)'''
 
-                # draw the screen!
-                self.screen.refresh()
-                await asyncio.sleep(FPS)
+def print_stats(mode):
+    print('mode: %s' % mode)
+    for name, samples in (('frame time', metrics.frame_times), ('packet latency', metrics.packet_latency)):
+        p50, p90, p99 = samples.percentiles(50, 90, 99)
+        if p50 is None:
+            print('%-15s no samples' % name)
+        else:
+            print('%-15s p50 %7.2f ms  p90 %7.2f ms  p99 %7.2f ms  (%d samples)' % (
+                name, p50 * 1000, p90 * 1000, p99 * 1000, len(samples)))
 
 
 @click.group()
-def cli():
-    pass
+@click.option('--log-level', default='info', show_default=True, type=click.Choice(LOG_LEVELS))
+@click.option('--log-file', default=LOG_FILE, show_default=True)
+@click.option('--no-log', is_flag=True, help='turn logging off')
+def cli(log_level, log_file, no_log):
+    init_logging(log_level, None if no_log else log_file)
 
 
 @cli.command()
 @click.argument('url')
-def connect(url):
-    c = Client()
-    screen_manager = ScreenManager()
+@click.option('--view-margin', default=VIEW_MARGIN, show_default=True,
+              help='tiles beyond the edge of the terminal within which entities are still ticked and drawn')
+@click.option('--fps', default=DEFAULT_FPS, show_default=True, help='target frame rate')
+@click.option('--encoding', 'encodings', multiple=True, default=[JsonCodec.name], show_default=True,
+              type=click.Choice(list(CODECS)),
+              help='accepted wire encodings in order of preference, can be given multiple times')
+@click.option('--batch-window', default=0, show_default=True,
+              help='ms to wait for more key presses before sending actions')
+@click.option('--coalesce', default='none', show_default=True, type=click.Choice(COALESCE_POLICIES),
+              help='how repeated movement keys in one batch are merged')
+@click.option('--max-in-flight', default=MAX_IN_FLIGHT, show_default=True,
+              help='action batches sent concurrently before new keys are held back and merged')
+@click.option('--prediction/--no-prediction', 'predict', default=True, show_default=True,
+              help='move the own player before the server confirms it')
+@click.option('--simulate-latency', default=0, show_default=True,
+              help='ms added to every sent and received packet')
+@click.option('--threaded', is_flag=True,
+              help='receive and decode packets in a separate thread')
+@click.option('--uvloop', 'use_uvloop', is_flag=True, help='use the uvloop event loop')
+@click.option('--stats', is_flag=True,
+              help='print frame time and packet latency percentiles when quitting')
+@click.option('--metrics', 'show_metrics', is_flag=True,
+              help='start with the performance overlay shown (toggle with p)')
+@click.option('--metrics-file', type=click.Path(dir_okay=False),
+              help='append performance counters as json lines to this file every second')
+@click.option('--record', type=click.Path(dir_okay=False),
+              help='record every received message to this trace file, see replay')
+@click.option('--reconnect/--no-reconnect', default=True, show_default=True,
+              help='connect again with a growing delay when the connection drops')
+@click.option('--map-cache', 'map_cache_dir', default=MAP_CACHE_DIR, show_default=True,
+              type=click.Path(file_okay=False), help='directory of the explored maps of every server')
+@click.option('--no-map-cache', is_flag=True, help='neither load nor save explored maps')
+def connect(url, view_margin, fps, encodings, batch_window, coalesce, max_in_flight, predict,
+            simulate_latency, threaded, use_uvloop, stats, show_metrics, metrics_file, record,
+            reconnect, map_cache_dir, no_map_cache):
+    # parse all sprites up front, spawning entities later only shares the loaded frames
+    sprite_library.preload(list(CREATURE_SPRITES.values()) + [PLAYER_SPRITE])
+
+    frame_scheduler.fps = fps
+    send_queue.batch_window = batch_window / 1000
+    send_queue.coalesce = coalesce
+
+    if predict and coalesce != 'none':
+        # moves are predicted per key press, the server would get fewer of them
+        raise click.UsageError('--coalesce %s drops moves that were already predicted, '
+                               'use it with --no-prediction' % coalesce)
+    prediction.enabled = predict
+
+    if use_uvloop:
+        try:
+            asyncio.set_event_loop(new_event_loop(use_uvloop=True))
+        except RuntimeError as e:
+            raise click.UsageError(str(e))
+
+    c = Client(encodings=encodings, max_in_flight=max_in_flight, latency=simulate_latency / 1000,
+               threaded=threaded, use_uvloop=use_uvloop, reconnect=reconnect)
+    screen_manager = ScreenManager(view_margin=view_margin, client=c, show_metrics=show_metrics)
+    if record:
+        c.recorder = TraceWriter(record, url=url, encodings=list(encodings))
 
     loop = asyncio.get_event_loop()
 
+    if not no_map_cache:
+        # drawn right away, the init packet fills in the rest
+        c.map_cache = MapCache(url, map_cache_dir)
+        c.map_cache.load(current_room, player)
+        loop.create_task(save_map_cache(c.map_cache, current_room, player))
+
     loop.create_task(c.init(url))
     loop.create_task(screen_manager.run())
+    if metrics_file:
+        loop.create_task(write_metrics(metrics, metrics_file))
 
     loop.run_forever()
 
+    if c.recorder:
+        recorder, c.recorder = c.recorder, None
+        recorder.close()
+    if c.map_cache:
+        c.map_cache.write(c.map_cache.snapshot(current_room, player))
+
+    if stats:
+        print_stats('%s%s' % ('threaded' if threaded else 'single loop', ', uvloop' if use_uvloop else ''))
+
+
+@cli.command()
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--headless', is_flag=True,
+              help='replay as fast as possible without a terminal and report the throughput')
+@click.option('--speed', default=1.0, show_default=True, help='playback speed on the terminal')
+@click.option('--view-margin', default=VIEW_MARGIN, show_default=True,
+              help='tiles beyond the edge of the terminal within which entities are still ticked and drawn')
+@click.option('--fps', default=DEFAULT_FPS, show_default=True,
+              help='target frame rate, frames per second of recorded time when headless')
+@click.option('--prediction/--no-prediction', 'predict', default=True, show_default=True,
+              help='reconcile the own player like connect would')
+@click.option('--stats', is_flag=True,
+              help='print frame time and packet latency percentiles at the end')
+@click.option('--metrics', 'show_metrics', is_flag=True,
+              help='start with the performance overlay shown (toggle with p)')
+def replay(path, headless, speed, view_margin, fps, predict, stats, show_metrics):
+    """
+    play a session recorded with connect --record through the client
+    """
+    try:
+        trace = TraceReader(path)
+    except (ValueError, OSError) as e:
+        raise click.UsageError(str(e))
+    logger.info('replaying %s: %s', path, trace.header)
+
+    sprite_library.preload(list(CREATURE_SPRITES.values()) + [PLAYER_SPRITE])
+    frame_scheduler.fps = fps
+    prediction.enabled = predict
+
+    c = Client(encodings=trace.header.get('encodings', [JsonCodec.name]))
+    # expect the binary encoding the recorded client offered, like connect does
+    c.handshake()
+    screen_manager = ScreenManager(view_margin=view_margin, client=c, show_metrics=show_metrics)
+
+    if headless:
+        from benchmarks.stub_screen import StubScreen
+        screen_manager.attach_screen(StubScreen())
+        elapsed = replay_headless(c, screen_manager, trace, fps)
+        print('%d packets in %.2f s: %.1f packets/s, %d frames, %.1f frames/s' % (
+            metrics.packets, elapsed, metrics.packets / elapsed, metrics.frames, metrics.frames / elapsed))
+    else:
+        loop = asyncio.get_event_loop()
+        loop.create_task(feed_trace(c, trace, speed))
+        loop.create_task(screen_manager.run())
+        loop.run_forever()
+
+    if stats:
+        print_stats('replay%s' % (' headless' if headless else ''))
+
 
 @cli.command()
 @click.argument('path')
@@ -322,6 +969,81 @@ def sprite(path):
     sprite_edit.run()
 
 
+@cli.command()
+@click.argument('paths', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+def build_sprite_cache(paths):
+    """
+    compile sprite files into the sprite cache (default: all files in sprites/)
+    """
+    from lib.creatures._sprite import SpriteData
+    from lib.creatures._sprite_cache import cache_path, write_cache
+
+    if not paths:
+        paths = sorted(glob.glob('sprites/*.yaml'))
+    for path in paths:
+        if write_cache(path, SpriteData.parse(path)):
+            print('%s -> %s' % (path, cache_path(path)))
+        else:
+            print('%s: could not write cache' % path)
+
+
+@cli.command()
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8765, show_default=True)
+@click.option('--map-size', default=200, show_default=True, help='the map is map-size x map-size tiles')
+@click.option('--creatures', 'creature_count', default=500, show_default=True)
+@click.option('--players', 'player_count', default=10, show_default=True,
+              help='bot players, connected clients come on top')
+@click.option('--move-rate', default=1.0, show_default=True,
+              help='moves per second of every creature and bot')
+@click.option('--churn', default=0.0, show_default=True,
+              help='creatures despawned and spawned again per second')
+@click.option('--packet-rate', default=20, show_default=True, help='update packets per second to each client')
+@click.option('--seed', type=int, help='for a reproducible world')
+def serve(host, port, map_size, creature_count, player_count, move_rate, churn, packet_rate, seed):
+    """
+    run a local stand-in game server with synthetic load, connect to ws://HOST:PORT/
+    """
+    from aiohttp import web
+    from lib.mock_server import MockServer, MockWorld
+
+    world = MockWorld(map_size=map_size, creature_count=creature_count, player_count=player_count,
+                      move_rate=move_rate, churn=churn, seed=seed)
+    server = MockServer(world, packet_rate=packet_rate)
+    print('serving on ws://%s:%d/' % (host, port))
+    web.run_app(server.make_app(), host=host, port=port, print=None)
+
+
+@cli.command()
+@click.option('--quick', is_flag=True, help='leave out the 1M tile map and 5000 creatures')
+@click.option('--filter', 'pattern', help='only run cases with this in their name')
+@click.option('--min-time', default=1.0, show_default=True, help='seconds each case is repeated for')
+@click.option('--save', type=click.Path(dir_okay=False), help='write the results as a baseline')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False),
+              help='compare the results against a saved baseline, exits with 1 on regressions')
+@click.option('--tolerance', default=10, show_default=True,
+              help='percent a case may get slower or use more memory before it counts as regression')
+def bench(quick, pattern, min_time, save, compare, tolerance):
+    """
+    headless benchmarks of map updates, ticking, drawing and packet handling
+    """
+    from benchmarks import suite
+
+    results = suite.run_suite(quick=quick, pattern=pattern, min_time=min_time)
+    if save:
+        suite.save_baseline(results, save)
+        print('baseline written to %s' % save)
+    if compare:
+        try:
+            baseline = suite.load_baseline(compare)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        print()
+        regressions = suite.compare(results, baseline, tolerance=tolerance / 100)
+        if regressions:
+            sys.exit(1)
+
+
 @cli.command()
 def print_colors():
     print('...')
@@ -341,4 +1063,5 @@ def print_colors():
             sleep(.5)
 
 
-cli()
+if __name__ == '__main__':
+    cli()
@@ -5,11 +5,8 @@ from asciimatics.event import KeyboardEvent
 from asciimatics.screen import ManagedScreen
 from ruamel.yaml import YAML
 
-from lib.init_logging import init_logging
 from sprite_edit.sprite_observer import SpriteObserver
 
-init_logging('debug')
-
 logger = logging.getLogger(__name__)
 
 yaml = YAML()
@@ -6,9 +6,6 @@ from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
 from lib.creatures._sprite import Sprite
-from lib.init_logging import init_logging
-
-init_logging('debug')
 
 logger = logging.getLogger(__name__)
 
@@ -53,7 +50,7 @@ class SpriteObserver:
 
     def _load_file(self, path):
         try:
-            sprite = Sprite(path)
+            sprite = Sprite(path, reload=True)
             self.sprite = sprite
             self._clear_exceptions()
         except Exception as e:
@@ -0,0 +1,86 @@
+import pytest
+
+from lib.creatures._sprite import Frame
+from lib.creatures.animation import Animator, numpy
+
+CLIP = (Frame(100, 'a', False, 0), Frame(100, 'b', False, 1))
+
+
+@pytest.fixture(params=[False, True] if numpy is not None else [False], ids=lambda use_numpy: 'numpy' if use_numpy else 'python')
+def animator(request):
+    return Animator(use_numpy=request.param)
+
+
+def playing(animator):
+    slot = animator.add()
+    animator.start(slot, animator.clip_id(CLIP))
+    animator.set_active(slot, True)
+    return slot
+
+
+def test_tick_moves_on_active_slots(animator):
+    slot = playing(animator)
+    idle = animator.add()
+    animator.start(idle, animator.clip_id(CLIP))
+
+    animator.tick(0.05)
+    assert animator.cells[slot] == 'a'
+    assert animator.time_to_next_frame() == pytest.approx(0.05)
+    animator.tick(0.06)
+    assert animator.cells[slot] == 'b'
+    assert animator.cells[idle] == 'a'
+
+
+def test_wake_fast_forwards_the_time_asleep(animator):
+    slot = playing(animator)
+    animator.sleep(slot)
+    assert not animator.active[slot]
+    assert animator.time_to_next_frame() is None
+
+    animator.tick(0.25)
+    assert animator.cells[slot] == 'a'
+    animator.wake(slot)
+
+    # 0.1 s of a, 0.1 s of b, then 0.05 s into a again
+    assert animator.active[slot]
+    assert animator.cells[slot] == 'a'
+    assert animator.idx[slot] == 0
+    assert animator.remaining(slot) == pytest.approx(0.05)
+
+
+def test_sleeping_slot_stays_asleep_when_activated(animator):
+    slot = playing(animator)
+    animator.sleep(slot)
+    # e.g. the entity went invisible and visible again while out of view
+    animator.set_active(slot, False)
+    animator.set_active(slot, True)
+    assert not animator.active[slot]
+    assert slot in animator.sleeping
+
+    animator.tick(0.15)
+    assert animator.cells[slot] == 'a'
+    animator.wake(slot)
+    assert animator.active[slot]
+    assert animator.cells[slot] == 'b'
+    assert animator.remaining(slot) == pytest.approx(0.05)
+
+
+def test_inactive_slot_does_not_move_while_asleep(animator):
+    slot = animator.add()
+    animator.start(slot, animator.clip_id(CLIP))
+    animator.sleep(slot)
+    animator.tick(1)
+    animator.wake(slot)
+
+    assert not animator.active[slot]
+    assert animator.cells[slot] == 'a'
+    assert animator.remaining(slot) == pytest.approx(0.1)
+
+
+def test_removed_slot_is_not_asleep(animator):
+    slot = playing(animator)
+    animator.sleep(slot)
+    animator.remove(slot)
+    assert slot not in animator.sleeping
+    assert slot not in animator.asleep
+    assert animator.add() == slot
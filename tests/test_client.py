@@ -0,0 +1,51 @@
+import json
+import time
+from collections import namedtuple
+
+import aiohttp
+import pytest
+
+import main
+from main import Client
+
+Message = namedtuple('Message', ('type', 'data'))
+
+
+def test_encoding_applies_to_the_next_message():
+    msgpack = pytest.importorskip('msgpack')
+    client = Client(encodings=('msgpack', 'json'))
+
+    # the binary frame arrives before the loop polls the inbox
+    encoding = Message(aiohttp.WSMsgType.TEXT, json.dumps({'type': 'encoding', 'data': 'msgpack'}))
+    update = Message(aiohttp.WSMsgType.BINARY, msgpack.packb({'type': 'update', 'tick': 3, 'data': {}}))
+    assert not client.receive(encoding)
+    assert client.receive(update)
+
+    assert [packet for _, packet in client.inbox] == [{'type': 'update', 'tick': 3, 'data': {}}]
+    assert client.last_tick == 3
+
+
+def test_binary_message_without_encoding_is_dropped():
+    client = Client()
+    assert not client.receive(Message(aiohttp.WSMsgType.BINARY, b'\x80'))
+    assert not client.inbox
+
+
+class SlowRecorder:
+    def __init__(self):
+        self.written = []
+
+    def write(self, msg, received):
+        self.written.append(received)
+        time.sleep(0.05)
+
+
+def test_recording_is_not_counted_as_decoding():
+    client = Client()
+    client.recorder = SlowRecorder()
+    main.metrics.decode_times.values.clear()
+    assert client.receive(Message(aiohttp.WSMsgType.TEXT, json.dumps({'type': 'update', 'data': {}})))
+
+    received, _ = client.inbox[0]
+    assert client.recorder.written == [received]
+    assert main.metrics.decode_times.values[-1] < 0.05
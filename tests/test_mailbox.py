@@ -0,0 +1,57 @@
+from lib.mailbox import PendingState
+
+
+def update(**data):
+    return {'type': 'update', 'data': data}
+
+
+def test_other_packets_are_not_merged():
+    pending = PendingState()
+    assert not pending.merge({'type': 'init', 'data': {}})
+    assert not pending
+    assert pending.drain() == []
+
+
+def test_last_write_wins_per_entity():
+    pending = PendingState()
+    pending.merge(update(creatures={'a': {'x': 1, 'y': 1, 'hp': 5}}))
+    pending.merge(update(creatures={'a': {'x': 2}}, players={'p': {'x': 0}}))
+    pending.merge(update(self={'hp': 3}))
+    pending.merge(update(self={'x': 4}))
+
+    assert pending.drain() == [update(
+        self={'hp': 3, 'x': 4},
+        players={'p': {'x': 0}},
+        creatures={'a': {'x': 2, 'y': 1, 'hp': 5}},
+    )]
+    assert not pending
+
+
+def test_removals_come_first_and_drop_pending_updates():
+    pending = PendingState()
+    pending.merge(update(creatures={'a': {'x': 1}, 'b': {'x': 2}}))
+    pending.merge({'type': 'remove_creatures', 'data': ['a']})
+    pending.merge({'type': 'remove_players', 'data': ['p']})
+    # updated again after its removal: spawned anew once the removal is applied
+    pending.merge(update(players={'p': {'x': 3}}))
+
+    assert pending.drain() == [
+        {'type': 'remove_players', 'data': ['p']},
+        {'type': 'remove_creatures', 'data': ['a']},
+        update(players={'p': {'x': 3}}, creatures={'b': {'x': 2}}),
+    ]
+
+
+def test_map_payloads_keep_their_order():
+    pending = PendingState()
+    pending.merge(update(map=[((0, 0), 'wall', (True, True)), ((1, 0), 'floor', (True, True))]))
+    pending.merge(update(map=[((0, 0), 'floor', (True, False))]))
+    fov = {'fov': [0, 0, 2, 1, 'AA==']}
+    pending.merge(update(map=fov))
+    pending.merge(update(map=[((1, 0), 'door', (True, True))]))
+
+    assert pending.drain() == [
+        update(map=[((0, 0), 'floor', (True, False)), ((1, 0), 'floor', (True, True))]),
+        update(map=fov),
+        update(map=[((1, 0), 'door', (True, True))]),
+    ]
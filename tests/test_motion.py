@@ -0,0 +1,65 @@
+import pytest
+
+from lib.creatures.motion import Interpolator, Prediction
+
+
+class Entity:
+    def __init__(self, x=0, y=0):
+        self.x = x
+        self.y = y
+
+
+def test_nothing_is_predicted_before_the_server_position():
+    prediction = Prediction()
+    entity = Entity()
+    assert not prediction.predict(entity, 'right', now=0)
+    assert (entity.x, entity.y) == (0, 0)
+
+
+def test_reconcile_keeps_moves_the_server_did_not_apply():
+    prediction = Prediction(timeout=1)
+    entity = Entity()
+    prediction.reconcile(entity, 0, 0, now=0)
+
+    assert prediction.predict(entity, 'right', now=0)
+    assert prediction.predict(entity, 'right', now=0)
+    assert prediction.predict(entity, 'down', now=0)
+    assert (entity.x, entity.y) == (2, 1)
+
+    # the server applied the first move
+    prediction.reconcile(entity, 1, 0, now=0.1)
+    assert len(prediction.pending) == 2
+    assert (entity.x, entity.y) == (2, 1)
+
+    # and then the other two
+    prediction.reconcile(entity, 2, 1, now=0.2)
+    assert not prediction.pending
+    assert (entity.x, entity.y) == (2, 1)
+
+
+def test_reconcile_drops_moves_after_the_timeout():
+    prediction = Prediction(timeout=0.5)
+    entity = Entity()
+    prediction.reconcile(entity, 0, 0, now=0)
+    prediction.predict(entity, 'left', now=0)
+    prediction.predict(entity, 'left', is_blocked=lambda x, y: x < -1, now=0)
+    assert (entity.x, entity.y) == (-1, 0)
+
+    # the server did not move, e.g. something the client did not know about was in the way
+    prediction.reconcile(entity, 0, 0, now=0.1)
+    assert (entity.x, entity.y) == (-1, 0)
+    prediction.reconcile(entity, 0, 0, now=1)
+    assert not prediction.pending
+    assert (entity.x, entity.y) == (0, 0)
+
+
+def test_interpolation_and_teleport():
+    motion = Interpolator()
+    motion.set_target(0, 0, 0)
+    motion.set_target(2, 0, 0.2)
+    assert motion.position(0.2) == (0, 0)
+    assert motion.position(0.3) == pytest.approx((1, 0))
+    assert motion.cell(1) == (2, 0)
+
+    motion.set_target(20, 0, 0.4)
+    assert motion.position(0.4) == (20, 0)
@@ -0,0 +1,51 @@
+from benchmarks.stub_screen import StubScreen
+from lib.render import FrameComposer, MapLayer
+from lib.room import CHUNK_SHIFT, Room
+
+GLYPHS = {'floor': '.', 'wall': '#'}
+
+
+def glyph(layer, x, y):
+    cell = layer.chunk_cells((0, 0))[(y << CHUNK_SHIFT) | x]
+    return None if cell is None else cell[0]
+
+
+def test_chunk_is_rendered_again_after_a_write():
+    room = Room()
+    layer = MapLayer(room, GLYPHS)
+    room.update_room([((0, 0), 'floor', (True, True))])
+    assert glyph(layer, 0, 0) == '.'
+    assert glyph(layer, 1, 0) is None
+
+    room.update_room([((1, 0), 'wall', (True, False))])
+    assert glyph(layer, 0, 0) == '.'
+    assert glyph(layer, 1, 0) == '#'
+
+
+def test_clear_with_another_intern_order():
+    room = Room()
+    layer = MapLayer(room, GLYPHS)
+    room.update_room([((0, 0), 'floor', (True, True)), ((1, 0), 'wall', (True, True))])
+    assert glyph(layer, 0, 0) == '.'
+
+    # e.g. the init packet of another room, same number of names in the other order
+    room.clear()
+    room.update_room([((0, 0), 'wall', (True, True)), ((1, 0), 'floor', (True, True))])
+    assert room.get_tile(0, 0).name == 'wall'
+    assert glyph(layer, 0, 0) == '#'
+    assert glyph(layer, 1, 0) == '.'
+
+
+def test_clear_drops_the_cached_chunks():
+    room = Room()
+    layer = MapLayer(room, GLYPHS)
+    room.update_room([((0, 0), 'floor', (True, True))])
+    frame = FrameComposer(StubScreen(8, 4))
+    frame.begin()
+    layer.blit(frame, 0, 0)
+    assert list(layer.rasters) == [(0, 0)]
+
+    room.clear()
+    frame.begin()
+    layer.blit(frame, 1000, 1000)
+    assert layer.rasters == {}
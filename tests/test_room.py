@@ -0,0 +1,55 @@
+import base64
+
+from lib.room import CHUNK_SIZE, Room
+
+
+def mask(bits):
+    """
+    :param bits: is_visible per cell, row major
+    :return: the base64 mask of a 'visibility' payload
+    """
+    value = sum(1 << n for n, bit in enumerate(bits) if bit)
+    return base64.b64encode(value.to_bytes((len(bits) + 7) // 8, 'little')).decode()
+
+
+def state(room, x, y):
+    tile = room.get_tile(x, y)
+    return None if tile is None else (tile.name, tile.seen, tile.is_visible)
+
+
+def test_visibility_across_a_chunk_boundary():
+    room = Room()
+    x0 = CHUNK_SIZE - 2
+    room.update_room({'rects': [[x0, 0, 4, 2, 'floor', False, False]]})
+    assert len(room.chunks) == 2
+
+    # the middle two columns of each row are visible, one on either side of the boundary
+    room.update_room({'visibility': [[x0, 0, 4, 2, mask([0, 1, 1, 0, 0, 1, 1, 0])]]})
+    for y in range(2):
+        assert state(room, x0, y) == ('floor', False, False)
+        assert state(room, x0 + 1, y) == ('floor', True, True)
+        assert state(room, x0 + 2, y) == ('floor', True, True)
+        assert state(room, x0 + 3, y) == ('floor', False, False)
+    assert len(room._visible_chunks) == 2
+
+    # visible tiles that go out of view stay seen
+    room.update_room({'visibility': [[x0, 0, 4, 2, mask([0] * 8)]]})
+    assert state(room, x0 + 1, 0) == ('floor', True, False)
+    assert state(room, x0 + 2, 1) == ('floor', True, False)
+
+
+def test_fov_clears_everything_outside():
+    room = Room()
+    room.update_room({'rects': [[0, 0, 2 * CHUNK_SIZE, 1, 'floor', True, True]]})
+    room.update_room({'fov': [CHUNK_SIZE - 1, 0, 2, 1, mask([1, 1])]})
+
+    visible = [x for x in range(2 * CHUNK_SIZE) if room.get_tile(x, 0).is_visible]
+    assert visible == [CHUNK_SIZE - 1, CHUNK_SIZE]
+    assert all(room.get_tile(x, 0).seen for x in range(2 * CHUNK_SIZE))
+
+
+def test_visibility_does_not_add_tiles():
+    room = Room()
+    room.update_room({'visibility': [[-1, -1, 2, 1, mask([1, 1])]]})
+    assert len(room) == 0
+    assert room.get_tile(-1, -1) is None
@@ -0,0 +1,41 @@
+from lib.spatial import SpatialHash
+
+
+def test_query_finds_entities_in_the_rect():
+    index = SpatialHash(shift=2)
+    index.move('a', 0, 0)
+    index.move('b', 3, 3)
+    index.move('c', 4, 0)
+    index.move('d', -1, -5)
+
+    assert sorted(index.query(0, 0, 4, 4)) == ['a', 'b']
+    assert sorted(index.query(1, 0, 5, 1)) == ['c']
+    assert sorted(index.query(-8, -8, 8, 8)) == ['a', 'b', 'c', 'd']
+    assert sorted(index.query(float('-inf'), float('-inf'), float('inf'), 0)) == ['d']
+    assert index.query(100, 100, 200, 200) == []
+
+
+def test_move_across_buckets():
+    index = SpatialHash(shift=2)
+    index.move('a', 1, 1)
+    index.move('a', 2, 1)
+    assert list(index.buckets) == [(0, 0)]
+
+    index.move('a', 9, 1)
+    assert list(index.buckets) == [(2, 0)]
+    assert index.query(0, 0, 4, 4) == []
+    assert index.query(8, 0, 12, 4) == ['a']
+    assert len(index) == 1
+
+
+def test_remove():
+    index = SpatialHash(shift=2)
+    index.move('a', 1, 1)
+    index.move('b', 2, 2)
+    index.remove('a')
+    index.remove('missing')
+
+    assert 'a' not in index
+    assert index.query(0, 0, 4, 4) == ['b']
+    index.remove('b')
+    assert index.buckets == {}